@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import platform
+import time
+from functools import partial
+from typing import Callable, Optional
+
+import numpy as np
+
+from wirenec_optimization.export_utils.utils import get_macros
+from wirenec_optimization.optimization_utils.cmaes_optimizer import objective_function
+from wirenec_optimization.optimization_utils.evaluator import ParallelEvaluator
+from wirenec_optimization.optimization_utils.scattering import scattering_spectra
+from wirenec_optimization.parametrization.base_parametrization import (
+    BaseStructureParametrization,
+)
+from wirenec_optimization.parametrization.layers_parametrization import (
+    LayersParametrization,
+)
+from wirenec_optimization.parametrization.spatial_parametrization import (
+    SpatialParametrization,
+)
+
+tau = 20e-3
+structures = {
+    "layers_3x3x1": partial(LayersParametrization, (3, 3), 1, tau, 10e-3, 0.9),
+    "layers_3x3x3": partial(LayersParametrization, (3, 3), 3, tau, 10e-3, 0.9),
+    "layers_5x5x3": partial(LayersParametrization, (5, 5), 3, tau, 10e-3, 0.9),
+    "spatial_2x1x1": partial(SpatialParametrization, (2, 1, 1), tau, tau, tau, 0.9),
+    "spatial_3x3x3": partial(SpatialParametrization, (3, 3, 3), tau, tau, tau, 0.9),
+}
+
+# Value of all type genes, None keeps the random types
+variants = {"wire": 0, "srr": 1, "mixed": None}
+
+default_cases = [
+    f"{structure}/{variant}" for structure in structures for variant in ("wire", "srr")
+]
+
+
+def sample_candidates(
+    parametrization: BaseStructureParametrization,
+    count: int,
+    variant: str = "mixed",
+    seed: int = 42,
+) -> np.ndarray:
+    bounds = parametrization.bounds
+    rng = np.random.RandomState(seed)
+    candidates = bounds[:, 0] + rng.rand(count, len(bounds)) * np.ptp(bounds, axis=1)
+
+    cells_count = int(parametrization.optimized_objects_count)
+    if variants[variant] is not None:
+        candidates[:, :cells_count] = variants[variant]
+    return candidates
+
+
+def time_stage(func: Callable, args: list) -> dict:
+    """
+    Calls func for every element of args and returns latency statistics in seconds.
+    """
+    times = []
+    for arg in args:
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+
+    times = np.array(times)
+    return {
+        "mean": float(times.mean()),
+        "median": float(np.median(times)),
+        "min": float(times.min()),
+        "std": float(times.std()),
+        "count": len(times),
+    }
+
+
+def measure_scaling(
+    objective: Callable,
+    candidates: np.ndarray,
+    workers: list,
+    backend: str = "process",
+    serial_rate: Optional[float] = None,
+) -> list:
+    """
+    Throughput of the evaluator for each worker count. Pool startup (including the
+    first task of every worker) is reported separately from steady-state throughput.
+    """
+    results = []
+    for num_workers in workers:
+        with ParallelEvaluator(backend, num_workers) as evaluator:
+            evaluator.set_objective(objective)
+
+            start = time.perf_counter()
+            evaluator.evaluate(candidates[:num_workers])
+            startup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            evaluator.evaluate(candidates)
+            elapsed = time.perf_counter() - start
+
+        rate = len(candidates) / elapsed
+        result = {
+            "workers": num_workers,
+            "pool_startup": startup,
+            "candidates_per_sec": rate,
+            "candidates_per_sec_per_core": rate / num_workers,
+        }
+        if serial_rate is not None:
+            result["efficiency"] = rate / (num_workers * serial_rate)
+        results.append(result)
+    return results
+
+
+def benchmark_case(
+    case: str,
+    frequencies: tuple = (9_000, 10_000),
+    scattering_angle: tuple = (90,),
+    repeats: int = 3,
+    workers: Optional[list] = None,
+    population: Optional[int] = None,
+    backend: str = "process",
+    seed: int = 42,
+) -> dict:
+    structure, variant = case.split("/")
+    parametrization = structures[structure]()
+    candidates = sample_candidates(parametrization, repeats, variant, seed)
+
+    geometries = [parametrization.get_geometry(params) for params in candidates]
+    objective = partial(
+        objective_function,
+        parametrization,
+        freq=frequencies,
+        scattering_angle=scattering_angle,
+    )
+
+    stages = {
+        "decode": time_stage(parametrization.get_wire_arrays, candidates),
+        "build": time_stage(parametrization.get_geometry, candidates),
+        "solve": time_stage(
+            partial(
+                scattering_spectra, freq=frequencies, scattering_angle=scattering_angle
+            ),
+            geometries,
+        ),
+        "objective": time_stage(objective, candidates),
+        "macros": time_stage(get_macros, geometries),
+    }
+
+    result = {
+        "case": case,
+        "objects": int(parametrization.optimized_objects_count),
+        "genes": len(parametrization.bounds),
+        "wires": len(geometries[0].wires),
+        "segments": int(parametrization.get_wire_arrays(candidates[0]).segments.sum()),
+        "stages": stages,
+    }
+
+    if workers:
+        serial_rate = 1 / stages["objective"]["mean"]
+        scaling_candidates = sample_candidates(
+            parametrization, population or 4 * max(workers), variant, seed + 1
+        )
+        result["scaling"] = measure_scaling(
+            objective, scaling_candidates, workers, backend, serial_rate
+        )
+    return result
+
+
+def run_benchmarks(cases: Optional[list] = None, **kwargs) -> dict:
+    return {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": kwargs,
+        },
+        "cases": [benchmark_case(case, **kwargs) for case in cases or default_cases],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of geometry building, solving and evaluator throughput"
+    )
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        default=default_cases,
+        help=f"structure/variant pairs, structures: {list(structures)}, "
+        f"variants: {list(variants)}",
+    )
+    parser.add_argument("--frequencies", nargs="+", type=float, default=[9_000, 10_000])
+    parser.add_argument("--scattering-angle", nargs="+", type=float, default=[90])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--workers",
+        nargs="*",
+        type=int,
+        default=None,
+        help="worker counts for the scaling benchmark (default: powers of two up to "
+        "the number of CPUs), pass no values to skip it",
+    )
+    parser.add_argument("--population", type=int, default=None)
+    parser.add_argument("--backend", default="process")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    workers = args.workers
+    if workers is None:
+        workers = [2**i for i in range(int(np.log2(os.cpu_count())) + 1)]
+
+    results = run_benchmarks(
+        args.cases,
+        frequencies=tuple(args.frequencies),
+        scattering_angle=tuple(args.scattering_angle),
+        repeats=args.repeats,
+        workers=workers,
+        population=args.population,
+        backend=args.backend,
+        seed=args.seed,
+    )
+    with open(args.output, "w") as fp:
+        json.dump(results, fp, indent=2)
+
+    for case in results["cases"]:
+        stages = ", ".join(
+            f"{stage} {stats['mean'] * 1e3:.2f} ms"
+            for stage, stats in case["stages"].items()
+        )
+        print(f"{case['case']}: {stages}")
+        for scaling in case.get("scaling", []):
+            print(
+                f"    {scaling['workers']} workers: "
+                f"{scaling['candidates_per_sec']:.2f} candidates/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import Optional
+
+from omegaconf import DictConfig
+
+
+class ExperimentBudget:
+    """
+    Solver evaluations and wall clock time shared by all optimization runs of an
+    experiment. Each run gets its share as evaluations/wall_clock stopping criteria.
+    """
+
+    def __init__(
+        self, evaluations: Optional[int] = None, wall_clock: Optional[float] = None
+    ):
+        self.evaluations = evaluations
+        self.wall_clock = wall_clock
+        self.spent = 0
+        # Shares handed out to runs that have not recorded their evaluations yet
+        self.allocated = 0
+
+        self._reserved = {}
+        self._deadline = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: DictConfig) -> "ExperimentBudget":
+        budget_config = config.get("budget") or {}
+        return cls(budget_config.get("evaluations"), budget_config.get("wall_clock"))
+
+    def start(self):
+        if self.wall_clock is not None:
+            self._deadline = time.monotonic() + self.wall_clock
+
+    @property
+    def remaining_time(self) -> Optional[float]:
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    @property
+    def exhausted(self) -> bool:
+        if self.evaluations is not None and self.spent >= self.evaluations:
+            return True
+        return self.remaining_time == 0.0
+
+    def record(self, evaluations: int, run=None):
+        """
+        Adds the evaluations made by a run and releases the share reserved for it.
+        """
+        with self._lock:
+            self.spent += evaluations
+            self.allocated -= self._reserved.pop(run, 0)
+
+    def stopping(self, runs_left: int = 1, spent_by_run: int = 0, run=None) -> dict:
+        """
+        Stopping criteria for the next run: an even share of the evaluations that are
+        neither spent nor reserved by running runs between runs_left runs (on top of
+        spent_by_run evaluations the run already made in previous calls) and the time
+        left until the deadline. The share stays reserved for the run until record is
+        called with the same run, so concurrent runs never get more than the budget.
+        """
+        criteria = {}
+        if self.evaluations is not None:
+            with self._lock:
+                available = self.evaluations - self.spent - self.allocated
+                share = max(0, available) // max(1, runs_left)
+                self.allocated += share - self._reserved.pop(run, 0)
+                self._reserved[run] = share
+            criteria["evaluations"] = {"max_evaluations": spent_by_run + share}
+        if self._deadline is not None:
+            criteria["wall_clock"] = {"seconds": self.remaining_time}
+        return criteria
@@ -1,12 +1,23 @@
+import math
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
 
 import numpy as np
 from omegaconf import DictConfig, OmegaConf
 
 from wirenec_optimization.experiment.base_experiment import BaseExperiment
+from wirenec_optimization.experiment.budget import ExperimentBudget
+from wirenec_optimization.experiment.results_export import ResultsExporter
 from wirenec_optimization.experiment.single_optimization_experiment import (
     SingleOptimizationExperiment,
+    cache_from_config,
+    evaluator_from_config,
 )
+from wirenec_optimization.optimization_utils.evaluation_cache import EvaluationCache
+from wirenec_optimization.optimization_utils.evaluator import ParallelEvaluator
 
 
 class MultiSeedOptimizationExperiment(BaseExperiment):
@@ -14,26 +25,266 @@ class MultiSeedOptimizationExperiment(BaseExperiment):
     def results(self):
         return 1
 
-    def __init__(self, config: DictConfig):
+    def __init__(
+        self,
+        config: DictConfig,
+        evaluator: Optional[ParallelEvaluator] = None,
+        cache: Optional[EvaluationCache] = None,
+    ):
         self.config = config
         self.seeds = np.arange(*config.get("seeds_range"))
         self.optimization_results = {}
         self.start_time_str = None
+        self.evaluator = evaluator
+        self.cache = cache
 
-    def run(self, save_each_iteration: bool = True):
-        self.start_time_str = time.strftime("%I_%M_%p_%B_%d_%Y")
+        # Solver evaluations made by each seed so far, over all rungs
+        self._evaluations = {}
 
-        for seed in self.seeds:
-            self.config.optimization_hyperparams.seed = int(seed)
-            experiment = SingleOptimizationExperiment(self.config)
-            experiment.run()
+    def get_seed_config(self, seed: int) -> DictConfig:
+        return OmegaConf.merge(
+            self.config, {"optimization_hyperparams": {"seed": int(seed)}}
+        )
 
-            if save_each_iteration:
-                base_path = f"data/optimization/experiment_{self.start_time_str}/"
-                experiment.save_results(base_path)
+    def run(self, save_each_iteration: bool = True, resume: Optional[str] = None):
+        """
+        resume: start time string of a previous run (the suffix of its
+        data/optimization/experiment_* directory) to continue from its checkpoints.
+        """
+        self.start_time_str = resume or time.strftime("%I_%M_%p_%B_%d_%Y")
+        base_path = f"data/optimization/experiment_{self.start_time_str}/"
+        cache = self.cache or cache_from_config(self.config)
+        exporter = ResultsExporter.from_config(self.config)
+        budget = ExperimentBudget.from_config(self.config)
+        budget.start()
 
+        def finish(seed: int, experiment: SingleOptimizationExperiment):
+            if save_each_iteration:
+                exporter.submit(experiment.save_results, base_path)
             self.optimization_results[seed] = experiment
 
+        scheduler_config = self.config.get("scheduler") or {}
+        halving_config = scheduler_config.get("successive_halving")
+        try:
+            if halving_config is None:
+                self._run_seeds(
+                    self.seeds, base_path, cache, budget, resume is not None, finish
+                )
+            else:
+                self._run_successive_halving(
+                    halving_config, base_path, cache, budget, resume is not None, finish
+                )
+        finally:
+            exporter.close()
+            if cache is not None and cache is not self.cache:
+                cache.close()
+
+    def _run_successive_halving(
+        self,
+        halving_config: DictConfig,
+        base_path: str,
+        cache: Optional[EvaluationCache],
+        budget: ExperimentBudget,
+        resume: bool,
+        finish: Callable,
+    ):
+        """
+        All seeds are optimized for min_iterations generations, then only the best
+        1 / eta of the seeds that are still improving continue for eta times more
+        generations, and so on until the configured number of iterations.
+        Converged seeds and seeds stopped by the budget are finished right away.
+        """
+        eta = halving_config.get("eta", 2)
+        max_iterations = self.config.optimization_hyperparams.get("iterations", 200)
+        # Rungs never exceed the configured iterations
+        rungs = [min(halving_config.get("min_iterations", 10), max_iterations)]
+        while rungs[-1] * eta < max_iterations:
+            rungs.append(rungs[-1] * eta)
+        if rungs[-1] < max_iterations:
+            rungs.append(max_iterations)
+
+        active = list(self.seeds)
+        for rung, iterations in enumerate(rungs):
+            # Later rungs continue the seeds from their checkpoints
+            experiments = self._run_seeds(
+                active,
+                base_path,
+                cache,
+                budget,
+                resume or rung > 0,
+                iterations=iterations,
+            )
+
+            unfinished = []
+            for seed, experiment in experiments.items():
+                stop_reason = experiment.optimized_dict["stop_reason"]
+                if stop_reason == "iterations" and rung < len(rungs) - 1:
+                    unfinished.append(seed)
+                else:
+                    finish(seed, experiment)
+
+            # Larger optimized_value is better unless maximize is set (see optimize)
+            sign = -1 if self.config.optimization_hyperparams.get("maximize") else 1
+            unfinished.sort(
+                key=lambda s: sign * experiments[s].optimized_dict["optimized_value"],
+                reverse=True,
+            )
+            active = unfinished[: math.ceil(len(unfinished) / eta)]
+            for seed in unfinished[len(active) :]:
+                finish(seed, experiments[seed])
+
+            if budget.exhausted:
+                for seed in active:
+                    finish(seed, experiments[seed])
+                break
+
+    def _run_seeds(
+        self,
+        seeds: list,
+        base_path: str,
+        cache: Optional[EvaluationCache],
+        budget: ExperimentBudget,
+        resume: bool,
+        finish: Optional[Callable] = None,
+        iterations: Optional[int] = None,
+    ) -> dict:
+        """
+        Runs the seeds sequentially or concurrently depending on the scheduler config.
+        finish is called for every seed as soon as it is done. Seeds are not started
+        once the budget is exhausted.
+        """
+        scheduler_config = self.config.get("scheduler") or {}
+        concurrent_seeds = min(scheduler_config.get("concurrent_seeds", 1), len(seeds))
+        runs_left = len(seeds)
+
+        def run_kwargs(seed: int) -> dict:
+            nonlocal runs_left
+            spent_by_run = self._evaluations.get(seed, 0)
+            stopping = budget.stopping(runs_left, spent_by_run, run=seed)
+            runs_left -= 1
+            return {"iterations": iterations, "stopping": stopping}
+
+        def record(seed: int, experiment: SingleOptimizationExperiment):
+            evaluations = experiment.optimized_dict["evaluations"]
+            budget.record(evaluations - self._evaluations.get(seed, 0), run=seed)
+            self._evaluations[seed] = evaluations
+            experiments[seed] = experiment
+            if finish is not None:
+                finish(seed, experiment)
+
+        experiments = {}
+        if concurrent_seeds > 1:
+            cpu_budget = scheduler_config.get("cpu_budget") or os.cpu_count()
+            self._run_concurrently(
+                seeds,
+                concurrent_seeds,
+                cpu_budget,
+                base_path,
+                cache,
+                budget,
+                resume,
+                run_kwargs,
+                record,
+            )
+        else:
+            self._run_sequentially(
+                seeds, base_path, cache, budget, resume, run_kwargs, record
+            )
+        return experiments
+
+    def _run_sequentially(
+        self,
+        seeds: list,
+        base_path: str,
+        cache: Optional[EvaluationCache],
+        budget: ExperimentBudget,
+        resume: bool,
+        run_kwargs: Callable,
+        record: Callable,
+    ):
+        evaluator = self.evaluator or evaluator_from_config(self.config)
+        try:
+            for seed in seeds:
+                if budget.exhausted:
+                    break
+
+                experiment = SingleOptimizationExperiment(
+                    self.get_seed_config(seed), evaluator, cache
+                )
+                experiment.run(base_path, resume=resume, **run_kwargs(seed))
+                record(seed, experiment)
+        finally:
+            if evaluator is not self.evaluator:
+                evaluator.shutdown()
+
+    def _run_concurrently(
+        self,
+        seeds: list,
+        concurrent_seeds: int,
+        cpu_budget: int,
+        base_path: str,
+        cache: Optional[EvaluationCache],
+        budget: ExperimentBudget,
+        resume: bool,
+        run_kwargs: Callable,
+        record: Callable,
+    ):
+        if self.evaluator is not None:
+            raise ValueError(
+                "A shared evaluator cannot be used with concurrent seeds, each seed "
+                "creates its own evaluator from the config"
+            )
+
+        # Seeds are driven from threads: the solver work happens in the evaluator
+        # workers, so each seed gets its own evaluator with a share of the CPU budget.
+        workers_per_seed = max(1, cpu_budget // concurrent_seeds)
+        lock = threading.Lock()
+
+        # The seeds share one Ray runtime sized for the whole CPU budget, so that
+        # neither its size nor its lifetime is tied to the seed that starts first
+        evaluator_config = self.config.get("evaluator") or {}
+        owns_ray = False
+        if evaluator_config.get("backend") == "ray":
+            import ray
+
+            if not ray.is_initialized():
+                ray.init(num_cpus=cpu_budget)
+                owns_ray = True
+
+        def run_seed(seed: int) -> Optional[SingleOptimizationExperiment]:
+            with lock:
+                if budget.exhausted:
+                    return None
+                kwargs = run_kwargs(seed)
+
+            # Worker processes are started from this thread, forking could copy a lock
+            # held by another seed's thread
+            evaluator = evaluator_from_config(
+                self.config, num_workers=workers_per_seed, start_method="spawn"
+            )
+            experiment = SingleOptimizationExperiment(
+                self.get_seed_config(seed), evaluator, cache
+            )
+            try:
+                experiment.run(base_path, resume=resume, **kwargs)
+            finally:
+                evaluator.shutdown()
+            return experiment
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrent_seeds) as executor:
+                futures = {executor.submit(run_seed, seed): seed for seed in seeds}
+                for future in as_completed(futures):
+                    experiment = future.result()
+
+                    # Plotting is not thread-safe, so results are exported from one
+                    # thread
+                    if experiment is not None:
+                        record(futures[future], experiment)
+        finally:
+            if owns_ray:
+                ray.shutdown()
+
     def save_results(
         self,
         path: str = "data/optimization/",
@@ -0,0 +1,69 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from matplotlib import pyplot as plt
+from omegaconf import DictConfig, OmegaConf
+
+default_export_options = {
+    "headless": False,
+    "background": False,
+    "scattering_plot": True,
+    "geometry_plot": True,
+    "macros": True,
+    "arrays": True,
+}
+
+
+def export_options_from_config(config: DictConfig) -> dict:
+    export_config = config.get("export")
+    options = dict(default_export_options)
+    if export_config is not None:
+        options.update(OmegaConf.to_container(export_config))
+
+    # GUI windows can not be shown from the background export thread
+    options["headless"] = options["headless"] or options["background"]
+    return options
+
+
+def use_headless_backend():
+    if plt.get_backend().lower() != "agg":
+        plt.switch_backend("Agg")
+
+
+class ResultsExporter:
+    def __init__(self, headless: bool = False, background: bool = False, **_):
+        self.headless = headless
+        self.background = background
+        self._futures = []
+
+        if headless or background:
+            use_headless_backend()
+
+        # A single worker keeps matplotlib calls serialized
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+
+    @classmethod
+    def from_config(cls, config: DictConfig) -> "ResultsExporter":
+        return cls(**export_options_from_config(config))
+
+    def submit(self, export: Callable, *args, **kwargs) -> Future:
+        if self._executor is None:
+            future = Future()
+            future.set_result(export(*args, **kwargs))
+        else:
+            future = self._executor.submit(export, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    def wait(self):
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
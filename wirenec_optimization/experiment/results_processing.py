@@ -1,26 +1,74 @@
 import json
-from typing import Callable
+from pathlib import Path
+from typing import Callable, Optional
 
 import matplotlib.pyplot as plt
 import numpy as np
 from wirenec.geometry import Geometry, Wire
 from wirenec.scattering import get_scattering_in_frequency_range
-from wirenec.visualization import scattering_plot
 
+from wirenec_optimization.optimization_utils.scattering import scattering_spectra
+
+# In-memory copies of dipolar limit tables, keyed by the path of the table on disk
+_dipolar_limit_tables = {}
+
+
+def _half_wave_dipole_scattering(f: float) -> float:
+    c = 299_792_458
+    l = c / (f * 1e6) / 2
+    g = Geometry([Wire((0, 0, -l / 2), (0, 0, l / 2), 0.5 * 1e-3)])
+    scattering = get_scattering_in_frequency_range(g, [f], 90, 90, 0, 270)
+    return scattering[0][0]
+
+
+def dipolar_limit_table(
+    freq_min: float,
+    freq_max: float,
+    table_path: str = "data/dipolar_limit_table.npz",
+    num: int = 64,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Scattering of a resonant half-wave dipole divided by the squared wavelength on a
+    log-spaced frequency grid. The table is stored on disk and only rebuilt when a
+    wider frequency range is requested.
+    """
+    table = _dipolar_limit_tables.get(table_path)
+    if table is None and Path(table_path).exists():
+        with np.load(table_path) as data:
+            table = data["freq"], data["normalized_scattering"]
+
+    if table is not None and table[0][0] <= freq_min and freq_max <= table[0][-1]:
+        _dipolar_limit_tables[table_path] = table
+        return table
+
+    if table is not None:
+        freq_min, freq_max = min(freq_min, table[0][0]), max(freq_max, table[0][-1])
 
-def dipolar_limit(freq: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     c = 299_792_458
+    freq = np.geomspace(freq_min, freq_max, num)
+    normalized = (
+        np.array([_half_wave_dipole_scattering(f) for f in freq])
+        / (c / (freq * 1e6)) ** 2
+    )
+
+    Path(table_path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(table_path, freq=freq, normalized_scattering=normalized)
+
+    _dipolar_limit_tables[table_path] = freq, normalized
+    return freq, normalized
+
+
+def dipolar_limit(
+    freq: np.ndarray, table_path: str = "data/dipolar_limit_table.npz"
+) -> tuple[np.ndarray, np.ndarray]:
+    c = 299_792_458
+    freq = np.asarray(freq, dtype=float)
     lbd = c / (freq * 1e6)
-    lengths = lbd / 2
 
-    res = []
-    for i, l in enumerate(lengths):
-        g = Geometry([Wire((0, 0, -l / 2), (0, 0, l / 2), 0.5 * 1e-3)])
-        f = freq[i]
-        scattering = get_scattering_in_frequency_range(g, [f], 90, 90, 0, 270)
-        res.append(scattering[0][0])
+    table_freq, normalized = dipolar_limit_table(freq.min(), freq.max(), table_path)
+    res = np.interp(np.log(freq), np.log(table_freq), normalized) * lbd**2
 
-    return freq, np.array(res)
+    return freq, res
 
 
 def single_channel_limit(freq: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
@@ -48,6 +96,84 @@ def plot_optimization_progress(optimized_dict: dict, ax: plt.axes) -> plt.axes:
     return ax
 
 
+def _local_maxima(spectra: np.ndarray) -> np.ndarray:
+    """
+    Indices of the local maxima of every column of the spectra (plateaus count once),
+    ordered from the highest.
+    """
+    padded = np.pad(spectra, ((1, 1), (0, 0)), constant_values=-np.inf)
+    is_max = (padded[1:-1] > padded[:-2]) & (padded[1:-1] >= padded[2:])
+    rows, columns = np.nonzero(is_max)
+    order = np.argsort(-spectra[rows, columns], kind="stable")
+    return rows[order]
+
+
+def adaptive_scattering_sweep(
+    g: Geometry,
+    freq_min: float,
+    freq_max: float,
+    scattering_angle: tuple = (90,),
+    num: int = 100,
+    max_num: int = 150,
+    curvature_tol: float = 2e-2,
+    peak_freq_tol: Optional[float] = None,
+    **scattering_kwargs,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Frequency sweep that starts from the uniform grid of num points and spends the
+    remaining max_num - num points bisecting the intervals around every local maximum
+    of every angle, highest first (until they are narrower than peak_freq_tol), then
+    the intervals where the normalized spectrum is curved. Resonances are therefore
+    found at least wherever the uniform grid finds them, and their peaks are resolved
+    finer. Returns frequencies and an array of shape (len(freq), len(scattering_angle)).
+    """
+    if peak_freq_tol is None:
+        peak_freq_tol = (freq_max - freq_min) / 1000
+
+    freq = np.linspace(freq_min, freq_max, num)
+    spectra = scattering_spectra(g, freq, scattering_angle, **scattering_kwargs)
+
+    while len(freq) < max_num:
+        widths = np.diff(freq)
+        normalized = spectra / np.maximum(np.abs(spectra).max(axis=0), 1e-300)
+
+        # Peaks first: both intervals around each local maximum, highest first
+        peak_intervals = []
+        for i in _local_maxima(spectra):
+            for interval in (i - 1, i):
+                if (
+                    0 <= interval < len(widths)
+                    and widths[interval] > peak_freq_tol
+                    and interval not in peak_intervals
+                ):
+                    peak_intervals.append(interval)
+
+        curvature = np.zeros(len(freq))
+        curvature[1:-1] = np.abs(np.diff(normalized, n=2, axis=0)).max(axis=1)
+        interval_error = np.maximum(curvature[:-1], curvature[1:])
+        curved_intervals = [
+            i
+            for i in np.argsort(-interval_error)
+            if interval_error[i] > curvature_tol and i not in peak_intervals
+        ]
+
+        refined = (peak_intervals + curved_intervals)[: max_num - len(freq)]
+        if not refined:
+            break
+
+        new_freq = freq[refined] + widths[refined] / 2
+        new_spectra = scattering_spectra(
+            g, new_freq, scattering_angle, **scattering_kwargs
+        )
+
+        freq = np.concatenate([freq, new_freq])
+        spectra = np.concatenate([spectra, new_spectra])
+        order = np.argsort(freq)
+        freq, spectra = freq[order], spectra[order]
+
+    return freq, spectra
+
+
 def plot_optimized_scattering(
     parametrization,
     objective_function: Callable,
@@ -56,9 +182,12 @@ def plot_optimized_scattering(
     freq_min: float = 5_000,
     freq_max: float = 14_000,
     num: int = 100,
+    max_num: int = 150,
     polarization_angle: float = 90.0,
     scattering_phi_angle: tuple = (90, 270),
     limit: Callable = dipolar_limit,
+    incidence_phi_angle: float = 90.0,
+    adaptive: bool = True,
 ):
     # x, y = limit(np.linspace(freq_min, freq_max, num))
     parameters_count = int(parametrization.optimized_objects_count)
@@ -74,22 +203,46 @@ def plot_optimized_scattering(
     g_optimized = objective_function(
         parametrization, params=optimized_dict["params"], geometry=True
     )
-    scattering_dict = {}
-    for angle in scattering_phi_angle:
-        freq, scattering = scattering_plot(
-            ax,
+    # All observation angles are read from a single solve per frequency
+    angles = np.atleast_1d(scattering_phi_angle)
+    if adaptive:
+        freq, spectra = adaptive_scattering_sweep(
             g_optimized,
+            freq_min,
+            freq_max,
+            angles,
+            num=num,
+            max_num=max_num,
             eta=polarization_angle,
-            frequency_start=freq_min,
-            frequency_finish=freq_max,
-            num_points=num,
-            phi=angle,
-            scattering_phi_angle=angle,
-            label=f"Optimized Geometry. {angle} degrees",
+            phi=incidence_phi_angle,
         )
+    else:
+        freq = np.linspace(freq_min, freq_max, num)
+        spectra = scattering_spectra(
+            g_optimized, freq, angles, eta=polarization_angle, phi=incidence_phi_angle
+        )
+
+    scattering_dict = {}
+    for angle, scattering in zip(angles.tolist(), spectra.T):
+        ax.plot(freq, scattering, label=f"Optimized Geometry. {angle} degrees")
         scattering_dict[angle] = scattering
 
     ax.set_xlim(freq_min, freq_max)
+    ax.set_xlabel("Frequency, MHz")
     ax.legend()
 
     return g_optimized, freq, scattering_dict, ax
+
+
+if __name__ == "__main__":
+    from wirenec_optimization.parametrization.sample_objects import SRRParametrization
+
+    # A split ring has a narrow resonance, the adaptive sweep must find its peak at
+    # least as well as the uniform grid of the same number of initial points
+    g = SRRParametrization().get_geometry(0.5, (0, 0, 0))
+    uniform_freq = np.linspace(5_000, 14_000, 100)
+    uniform = scattering_spectra(g, uniform_freq, (90,))[:, 0]
+    freq, spectra = adaptive_scattering_sweep(g, 5_000, 14_000, (90,))
+    print(f"uniform: max {uniform.max():.4e} at {uniform_freq[uniform.argmax()]} MHz")
+    print(f"adaptive: max {spectra.max():.4e} at {freq[spectra.argmax()]} MHz")
+    assert spectra.max() >= uniform.max()
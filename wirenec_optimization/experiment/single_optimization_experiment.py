@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import numpy as np
 from matplotlib import pyplot as plt
@@ -13,10 +13,22 @@ from wirenec_optimization.experiment import (
     write_to_file,
 )
 from wirenec_optimization.experiment.base_experiment import BaseExperiment
+from wirenec_optimization.experiment.budget import ExperimentBudget
+from wirenec_optimization.experiment.results_export import (
+    export_options_from_config,
+    use_headless_backend,
+)
 from wirenec_optimization.export_utils.utils import get_macros
 from wirenec_optimization.optimization_utils.cmaes_optimizer import (
     objective_function,
-    cma_optimize,
+    optimize,
+)
+from wirenec_optimization.optimization_utils.convergence import DEFAULT_STOPPING
+from wirenec_optimization.optimization_utils.evaluation_cache import EvaluationCache
+from wirenec_optimization.optimization_utils.evaluator import ParallelEvaluator
+from wirenec_optimization.optimization_utils.run_log import RunLog
+from wirenec_optimization.optimization_utils.warm_start import (
+    load_warm_start_solutions,
 )
 from wirenec_optimization.parametrization.layers_parametrization import (
     LayersParametrization,
@@ -31,8 +43,39 @@ parametrization_mapping = {
 }
 
 
+def evaluator_from_config(
+    config: DictConfig,
+    num_workers: Optional[int] = None,
+    start_method: Optional[str] = None,
+) -> ParallelEvaluator:
+    """
+    start_method is used unless the config sets one.
+    """
+    evaluator_config = config.get("evaluator")
+    evaluator_kwargs = (
+        {} if evaluator_config is None else OmegaConf.to_container(evaluator_config)
+    )
+    if num_workers is not None:
+        evaluator_kwargs["num_workers"] = num_workers
+    if start_method is not None:
+        evaluator_kwargs.setdefault("start_method", start_method)
+    return ParallelEvaluator(**evaluator_kwargs)
+
+
+def cache_from_config(config: DictConfig) -> Optional[EvaluationCache]:
+    cache_config = config.get("cache")
+    if cache_config is None:
+        return None
+    return EvaluationCache(**OmegaConf.to_container(cache_config))
+
+
 class SingleOptimizationExperiment(BaseExperiment):
-    def __init__(self, config: DictConfig):
+    def __init__(
+        self,
+        config: DictConfig,
+        evaluator: Optional[ParallelEvaluator] = None,
+        cache: Optional[EvaluationCache] = None,
+    ):
         self.config = config
         self.parametrization_name = config.get("parametrization_name")
         self.parametrization_hyperparams = OmegaConf.to_container(
@@ -46,11 +89,96 @@ class SingleOptimizationExperiment(BaseExperiment):
             **self.parametrization_hyperparams
         )
         self.optimized_dict = None
+        self.evaluator = evaluator
+        self.cache = cache
 
-    def run(self):
-        self.optimized_dict = cma_optimize(
-            self.parametrization, **self.optimization_hyperparams
+    def get_results_path(self, path: str = "data/optimization/") -> Path:
+        path += f"{self.parametrization.structure_name}__"
+        for param, value in self.parametrization_hyperparams.items():
+            path += f"{param}_{str(value)}__"
+        for param, value in self.optimization_hyperparams.items():
+            path += f"{param}_{str(value)}__"
+        return Path(path.rstrip("_"))
+
+    def get_warm_start_kwargs(self) -> dict:
+        warm_start_config = self.config.get("warm_start")
+        if warm_start_config is None:
+            return {}
+
+        solutions = load_warm_start_solutions(
+            warm_start_config.get("path", "data/optimization/"),
+            self.parametrization.structure_name,
+            self.parametrization_hyperparams,
+            len(self.parametrization.bounds),
+            top_k=warm_start_config.get("top_k"),
         )
+        return {
+            "warm_start_solutions": solutions,
+            "warm_start_gamma": warm_start_config.get("gamma", 0.1),
+            "warm_start_alpha": warm_start_config.get("alpha", 0.1),
+        }
+
+    def get_stopping(self, stopping: Optional[dict] = None) -> Optional[dict]:
+        """
+        Configured stopping criteria with the budget section of the config and the
+        given criteria on top.
+        """
+        budget = ExperimentBudget.from_config(self.config)
+        budget.start()
+        configured = self.optimization_hyperparams.get("stopping")
+        extra = {**budget.stopping(), **(stopping or {})}
+        if not extra:
+            return configured
+        return {**(configured or DEFAULT_STOPPING), **extra}
+
+    def run(
+        self,
+        path: str = "data/optimization/",
+        resume: bool = False,
+        iterations: Optional[int] = None,
+        stopping: Optional[dict] = None,
+    ):
+        """
+        iterations and stopping override the optimization hyperparameters without
+        changing the results path, so a run can be continued in several calls.
+        """
+        evaluator = self.evaluator or evaluator_from_config(self.config)
+        cache = self.cache or cache_from_config(self.config)
+
+        results_path = self.get_results_path(path)
+        run_log_config = self.config.get("run_log")
+        run_log = None
+        if run_log_config is not None:
+            run_log = RunLog(
+                results_path / "run_log", **OmegaConf.to_container(run_log_config)
+            )
+
+        optimization_hyperparams = dict(self.optimization_hyperparams)
+        optimization_hyperparams["stopping"] = self.get_stopping(stopping)
+        if iterations is not None:
+            optimization_hyperparams["iterations"] = iterations
+        optimization_hyperparams.setdefault(
+            "profile_dir", str(results_path / "profiles")
+        )
+
+        try:
+            self.optimized_dict = optimize(
+                self.parametrization,
+                evaluator=evaluator,
+                cache=cache,
+                checkpoint_path=str(results_path / "checkpoint.pkl"),
+                resume=resume,
+                run_log=run_log,
+                **self.get_warm_start_kwargs(),
+                **optimization_hyperparams,
+            )
+        finally:
+            if run_log is not None:
+                run_log.close()
+            if evaluator is not self.evaluator:
+                evaluator.shutdown()
+            if cache is not None and cache is not self.cache:
+                cache.close()
 
     @property
     def results(self):
@@ -60,41 +188,55 @@ class SingleOptimizationExperiment(BaseExperiment):
         self,
         path: str = "data/optimization/",
     ) -> Any:
-        path += f"{self.parametrization.structure_name}__"
-        for param, value in self.parametrization_hyperparams.items():
-            path += f"{param}_{str(value)}__"
-        for param, value in self.optimization_hyperparams.items():
-            path += f"{param}_{str(value)}__"
-        path = Path(path.rstrip("_"))
+        options = export_options_from_config(self.config)
+        if options["headless"]:
+            use_headless_backend()
 
+        path = self.get_results_path(path)
         path.mkdir(parents=True, exist_ok=True)
 
-        fig, ax = plt.subplots(2, figsize=(6, 8))
-
-        tmp = plot_optimized_scattering(
-            self.parametrization,
-            objective_function,
-            self.optimized_dict,
-            ax[0],
-            scattering_phi_angle=self.optimization_hyperparams.get("scattering_angle"),
+        g_optimized = objective_function(
+            self.parametrization, params=self.optimized_dict["params"], geometry=True
         )
-        g_optimized, freq, scattering_dict, ax[0] = tmp
 
-        ax[1] = plot_optimization_progress(self.optimized_dict, ax[1])
+        if options["scattering_plot"]:
+            fig, ax = plt.subplots(2, figsize=(6, 8))
 
-        final_spectra_stats = {}
-        for angle, sc in scattering_dict.items():
-            final_spectra_stats[f"{angle}_argmax"] = freq[np.argmax(sc)]
-            final_spectra_stats[f"{angle}_max"] = np.max(sc)
+            tmp = plot_optimized_scattering(
+                self.parametrization,
+                objective_function,
+                self.optimized_dict,
+                ax[0],
+                scattering_phi_angle=self.optimization_hyperparams.get(
+                    "scattering_angle"
+                ),
+            )
+            g_optimized, freq, scattering_dict, ax[0] = tmp
 
-        fig.savefig(path / "scattering_progress.pdf", dpi=200, bbox_inches="tight")
-        plt.show()
+            ax[1] = plot_optimization_progress(self.optimized_dict, ax[1])
 
-        plot_geometry(
-            g_optimized, from_top=False, save_to=path / "optimized_geometry.pdf"
-        )
+            final_spectra_stats = {}
+            for angle, sc in scattering_dict.items():
+                final_spectra_stats[f"{angle}_argmax"] = freq[np.argmax(sc)]
+                final_spectra_stats[f"{angle}_max"] = np.max(sc)
+
+            fig.savefig(path / "scattering_progress.pdf", dpi=200, bbox_inches="tight")
+            if not options["headless"]:
+                plt.show()
+            plt.close(fig)
+
+            write_to_file(f"{path}/optimized_results.json", final_spectra_stats)
+
+        if options["geometry_plot"]:
+            plot_geometry(
+                g_optimized, from_top=False, save_to=path / "optimized_geometry.pdf"
+            )
+            plt.close("all")
 
         self.optimized_dict["params"] = list(self.optimized_dict["params"])
+        timings = self.optimized_dict.pop("timings", None)
+        if timings is not None:
+            write_to_file(f"{path}/timings.json", timings)
 
         write_to_file(
             f"{path}/parametrization_hyperparams.json", self.parametrization_hyperparams
@@ -103,8 +245,10 @@ class SingleOptimizationExperiment(BaseExperiment):
             f"{path}/optimization_hyperparams.json", self.optimization_hyperparams
         )
         write_to_file(f"{path}/optimized_params.json", self.optimized_dict)
-        write_to_file(
-            f"{path}/progress.npy", self.optimized_dict["progress"], "wb", False
-        )
-        write_to_file(f"{path}/macros.txt", get_macros(g_optimized), "w", False)
-        write_to_file(f"{path}/optimized_results.json", final_spectra_stats)
+
+        if options["arrays"]:
+            write_to_file(
+                f"{path}/progress.npy", self.optimized_dict["progress"], "wb", False
+            )
+        if options["macros"]:
+            write_to_file(f"{path}/macros.txt", get_macros(g_optimized), "w", False)
@@ -0,0 +1,25 @@
+import os
+import pickle
+from pathlib import Path
+from typing import Optional
+
+
+def save_checkpoint(path: [str, Path], state: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first so that a killed job never leaves a broken
+    # checkpoint
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as fp:
+        pickle.dump(state, fp)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: [str, Path]) -> Optional[dict]:
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    with open(path, "rb") as fp:
+        return pickle.load(fp)
@@ -1,14 +1,36 @@
-from typing import Tuple
+from collections import deque
+from functools import partial
+from typing import Optional, Tuple
+
+import math
+import time
 
 import matplotlib.pyplot as plt
 import numpy as np
-import ray
-from cmaes import CMA
-from ray.util.multiprocessing import Pool
-from scipy.stats import linregress
 from tqdm import tqdm
-from wirenec.scattering import get_scattering_in_frequency_range
 
+from wirenec_optimization.optimization_utils.checkpoint import (
+    load_checkpoint,
+    save_checkpoint,
+)
+from wirenec_optimization.optimization_utils.convergence import ConvergenceMonitor
+from wirenec_optimization.optimization_utils.evaluation_cache import EvaluationCache
+from wirenec_optimization.optimization_utils.evaluator import ParallelEvaluator
+from wirenec_optimization.optimization_utils.instrumentation import (
+    GenerationProfiler,
+    StageTimer,
+    TimingReport,
+)
+from wirenec_optimization.optimization_utils.optimizers import (
+    RestartStrategy,
+    make_optimizer,
+)
+from wirenec_optimization.optimization_utils.run_log import RunLog
+from wirenec_optimization.optimization_utils.surrogate import RBFSurrogate
+from wirenec_optimization.optimization_utils.warm_start import (
+    get_warm_start_distribution,
+)
+from wirenec_optimization.optimization_utils.scattering import scattering_spectra
 from wirenec_optimization.parametrization.base_parametrization import (
     BaseStructureParametrization,
 )
@@ -21,36 +43,127 @@ def objective_function(
     geometry: bool = False,
     scattering_angle: tuple = (90,),
     maximize: bool = False,
+    full_output: bool = False,
+    fidelity: float = 1.0,
+    stage_timings: bool = False,
 ):
-    g = parametrization.get_geometry(params=params)
+    """
+    With stage_timings returns the output together with the time spent building the
+    geometry and solving it.
+    """
+    start = time.perf_counter()
+    g = parametrization.get_geometry(params=params, fidelity=fidelity)
+    build_time = time.perf_counter() - start
     factor = -1 if maximize else 1
     if not geometry:
-        scattering, _ = get_scattering_in_frequency_range(
-            g, freq, 90, 90, 90, scattering_angle
-        )
-        return factor * np.mean(scattering)
+        scattering = scattering_spectra(g, freq, scattering_angle)
+        solve_time = time.perf_counter() - start - build_time
+
+        output = factor * np.mean(scattering)
+        if full_output:
+            output = output, scattering
+        if stage_timings:
+            return output, {"build": build_time, "solve": solve_time}
+        return output
 
     else:
         return g
 
 
-def check_convergence(
-    progress, num_for_progress: int = 100, slope_for_progress: float = 1e-8
-):
-    if len(progress) > num_for_progress:
-        slope1 = linregress(
-            range(len(progress[-num_for_progress:])), progress[-num_for_progress:]
-        ).slope
-        slope2 = linregress(range(len(progress[-3:])), progress[-3:]).slope
+class PendingPopulation:
+    """
+    Population whose evaluation is already dispatched to the evaluator. Cached
+    values are taken immediately, the remaining ones are collected in order.
+    With full_output the objective returns (value, scattering) for every candidate.
+    Candidates with a finite surrogate prediction (and no cached value) are not
+    evaluated, the prediction is used as their value. Candidates are evaluated at the
+    given fidelity. Solved candidates get the id of their worker (-1 otherwise), stage
+    times and the time.time() their evaluation finished at in the worker.
+    """
+
+    def __init__(
+        self,
+        evaluator: ParallelEvaluator,
+        population: np.ndarray,
+        cache: Optional[EvaluationCache] = None,
+        keys: Optional[list] = None,
+        full_output: bool = False,
+        predicted: Optional[np.ndarray] = None,
+        fidelity: float = 1.0,
+    ):
+        self.population = population
+        self.cache = cache
+        self.full_output = full_output
+
+        self.values = np.full(len(population), np.nan)
+        self.scattering = [None] * len(population)
+        self.eval_time = np.zeros(len(population))
+        self.cached = np.zeros(len(population), dtype=bool)
+        self.predicted = (
+            np.full(len(population), np.nan) if predicted is None else predicted
+        )
+        self.surrogate = np.zeros(len(population), dtype=bool)
+        self.fidelity = np.full(len(population), fidelity)
+
+        self.worker = np.full(len(population), -1)
+        self.build_time = np.zeros(len(population))
+        self.solve_time = np.zeros(len(population))
+        self.arrival = np.full(len(population), np.nan)
+
+        self._pending = {}
+        for i in range(len(population)):
+            output = None if cache is None else cache.get(keys[i])
+            if output is not None:
+                self._store([i], output)
+                self.cached[i] = True
+            elif np.isfinite(self.predicted[i]):
+                self.values[i] = self.predicted[i]
+                self.surrogate[i] = True
+            else:
+                self._pending.setdefault(i if cache is None else keys[i], []).append(i)
+
+        first_indices = [indices[0] for indices in self._pending.values()]
+        self._results = evaluator.imap(
+            population[first_indices], timed=True, fidelity=fidelity, stage_timings=True
+        )
+
+    @property
+    def solved(self) -> int:
+        """
+        Number of candidates sent to the solver.
+        """
+        return len(self._pending)
+
+    def _store(self, indices: list, output):
+        value, scattering = output if self.full_output else (output, None)
+        for i in indices:
+            self.values[i] = value
+            self.scattering[i] = scattering
+
+    def collect(self, pbar: tqdm) -> np.ndarray:
+        pbar.update(int(self.cached.sum() + self.surrogate.sum()))
+        # Results go first, so that the evaluator sees the end of the iterator and can
+        # release its buffers
+        for result, key in zip(self._results, self._pending):
+            (output, stage_times), elapsed, worker, finished_at = result
+            if self.cache is not None:
+                self.cache.put(key, output)
 
-        if abs(slope1) <= slope_for_progress and abs(slope2) <= slope_for_progress:
-            print("Minimum slope converged")
-            return True
+            # Duplicates within the population are solved only once
+            first, *duplicates = self._pending[key]
+            self._store([first, *duplicates], output)
+            self.eval_time[first] = elapsed
+            self.worker[first] = worker
+            self.build_time[first] = stage_times["build"]
+            self.solve_time[first] = stage_times["solve"]
+            self.arrival[first] = finished_at
+            self.cached[duplicates] = True
+            pbar.update(1 + len(duplicates))
 
-    return False
+        return self.values
 
 
-def cma_optimize(
+def optimize(
     structure_parametrization: BaseStructureParametrization,
     iterations: int = 200,
     seed: int = 48,
@@ -59,71 +172,364 @@ def cma_optimize(
     scattering_angle: tuple = (90,),
     population_size_factor: float = 1,
     maximize: bool = False,
+    evaluator: Optional[ParallelEvaluator] = None,
+    cache: Optional[EvaluationCache] = None,
+    async_generations: int = 1,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_every: int = 10,
+    resume: bool = False,
+    run_log: Optional[RunLog] = None,
+    warm_start_solutions: Optional[list] = None,
+    warm_start_gamma: float = 0.1,
+    warm_start_alpha: float = 0.1,
+    surrogate_fraction: Optional[float] = None,
+    surrogate_exploration: float = 0.2,
+    low_fidelity: Optional[float] = None,
+    low_fidelity_fraction: float = 0.3,
+    stopping: Optional[dict] = None,
+    callbacks: Optional[list] = None,
+    profile_generations: tuple = (),
+    profile_dir: Optional[str] = None,
+    algorithm: str = "cma",
+    algorithm_kwargs: Optional[dict] = None,
+    restarts: Optional[dict] = None,
 ):
-    np.random.seed(seed)
+    """
+    algorithm is the name of the ask/tell optimizer (see OPTIMIZERS), algorithm_kwargs
+    are passed to it. restarts are the keyword arguments of the RestartStrategy, the
+    optimizer is then restarted when a convergence criterion fires (or it stops by
+    itself) until the restarts, iterations or budget are exhausted. callbacks are called
+    with the timing statistics of every generation (see TimingReport), the generations
+    in profile_generations are profiled with cProfile.
+    """
+    # Local generator instead of np.random.seed, so that seeds can run in parallel
+    # threads
+    rng = np.random.RandomState(seed)
     bounds = structure_parametrization.bounds
     lower_bounds, upper_bounds = bounds[:, 0], bounds[:, 1]
-    mean = lower_bounds + (np.random.rand(len(bounds)) * (upper_bounds - lower_bounds))
+    mean = lower_bounds + (rng.rand(len(bounds)) * (upper_bounds - lower_bounds))
     sigma = 2 * (upper_bounds[0] - lower_bounds[0]) / 3
+    cov = None
 
-    optimizer = CMA(
-        mean=mean,
-        sigma=sigma,
-        bounds=bounds,
-        seed=seed,
-        population_size=int(len(bounds) * population_size_factor),
+    if warm_start_solutions:
+        mean, sigma, cov = get_warm_start_distribution(
+            warm_start_solutions, bounds, warm_start_gamma, warm_start_alpha
+        )
+
+    population_size = int(len(bounds) * population_size_factor)
+    optimizer = make_optimizer(
+        algorithm,
+        bounds,
+        mean,
+        sigma,
+        seed,
+        population_size,
+        cov,
+        structure_parametrization.steps,
+        **(algorithm_kwargs or {}),
     )
 
+    # Restarts share the pool, cache, surrogate, best solution and budget of the run
+    restart_strategy = None
+    if restarts is not None:
+        restart_strategy = RestartStrategy(
+            population_size, 2 * (upper_bounds[0] - lower_bounds[0]) / 3, **restarts
+        )
+
     cnt = 0
     best_value, best_params = 0 if maximize else np.inf, []
 
     progress = []
+    monitor = ConvergenceMonitor.from_config(stopping, maximize)
+    timer = StageTimer()
+    report = TimingReport(callbacks)
+    profiler = GenerationProfiler(profile_generations, profile_dir)
 
-    ray.init(num_cpus=8)
-    pool = Pool()
+    # Only surrogate_fraction of each generation is solved once the surrogate is trained
+    surrogate = None
+    if surrogate_fraction is not None:
+        surrogate = RBFSurrogate(bounds)
 
-    for generation in tqdm(range(iterations)):
-        solutions = []
-        params_list = [optimizer.ask() for _ in range(optimizer.population_size)]
+    owns_evaluator = evaluator is None
+    if owns_evaluator:
+        evaluator = ParallelEvaluator()
 
-        with tqdm(total=optimizer.population_size) as pbar:
-            values = []
-            for value in pool.imap(
-                lambda params: objective_function(
+    evaluator.set_objective(
+        partial(
+            objective_function,
+            structure_parametrization,
+            freq=frequencies,
+            scattering_angle=scattering_angle,
+            maximize=maximize,
+            full_output=run_log is not None,
+        )
+    )
+
+    def evaluate(
+        params_list: np.ndarray,
+        fidelity: float = 1.0,
+        predicted: Optional[np.ndarray] = None,
+    ) -> PendingPopulation:
+        keys = None
+        if cache is not None:
+            keys = [
+                cache.key(
                     structure_parametrization,
                     params,
-                    freq=frequencies,
-                    scattering_angle=scattering_angle,
-                    maximize=maximize,
-                ),
-                params_list,
+                    tuple(np.atleast_1d(frequencies)),
+                    tuple(np.atleast_1d(scattering_angle)),
+                    maximize,
+                    run_log is not None,
+                    fidelity,
+                )
+                for params in params_list
+            ]
+        return PendingPopulation(
+            evaluator,
+            params_list,
+            cache,
+            keys,
+            full_output=run_log is not None,
+            predicted=predicted,
+            fidelity=fidelity,
+        )
+
+    def submit_generation(
+        params_list: Optional[np.ndarray] = None, predicted: Optional[np.ndarray] = None
+    ):
+        if params_list is None:
+            with timer.stage("ask"):
+                params_list = np.empty((optimizer.population_size, len(bounds)))
+                for i in range(optimizer.population_size):
+                    params_list[i] = optimizer.ask()
+            if surrogate is not None:
+                with timer.stage("screen"):
+                    predicted = surrogate.screen(
+                        params_list, surrogate_fraction, surrogate_exploration, rng
+                    )
+
+        fidelity = 1.0 if low_fidelity is None else low_fidelity
+        with timer.stage("dispatch"):
+            in_flight.append(evaluate(params_list, fidelity, predicted))
+
+    def refine(
+        pending: PendingPopulation, pbar: tqdm
+    ) -> tuple[np.ndarray, PendingPopulation]:
+        """
+        Re-evaluates the best low fidelity candidates at full fidelity and merges the
+        results into the population. Returns the values to tell, where the remaining
+        candidates keep their low fidelity ranking behind the worst refined one, and
+        the full fidelity evaluation.
+        """
+        (evaluated,) = np.nonzero(~pending.surrogate)
+        order = evaluated[np.argsort(pending.values[evaluated], kind="stable")]
+        count = max(1, math.ceil(low_fidelity_fraction * len(evaluated)))
+        survivors, rest = order[:count], order[count:]
+
+        full = evaluate(pending.population[survivors])
+        pbar.total += len(survivors)
+        full.collect(pbar)
+
+        told = pending.values.copy()
+        told[rest] += full.values.max() - told[survivors].max()
+        told[survivors] = full.values
+
+        pending.values[survivors] = full.values
+        pending.eval_time[survivors] += full.eval_time
+        pending.cached[survivors] = full.cached
+        pending.fidelity[survivors] = 1.0
+        for i, scattering in zip(survivors, full.scattering):
+            pending.scattering[i] = scattering
+        return told, full
+
+    def restart(generation: int, reason: str):
+        """
+        New optimizer from a random mean with the population and step size of the next
+        restart. Generations sampled by the old optimizer are dropped.
+        """
+        restart_size, restart_sigma = restart_strategy.next(rng, generation, reason)
+        restart_mean = lower_bounds + rng.rand(len(bounds)) * (
+            upper_bounds - lower_bounds
+        )
+        in_flight.clear()
+        monitor.restart()
+        return make_optimizer(
+            algorithm,
+            bounds,
+            restart_mean,
+            restart_sigma,
+            seed + len(restart_strategy.history),
+            restart_size,
+            steps=structure_parametrization.steps,
+            **(algorithm_kwargs or {}),
+        )
+
+    def make_checkpoint(
+        generation: int, converged: bool = False, stop_reason: Optional[str] = None
+    ):
+        if run_log is not None:
+            run_log.flush()
+        if checkpoint_path is None:
+            return
+        save_checkpoint(
+            checkpoint_path,
+            {
+                "generation": generation,
+                "converged": converged,
+                "stop_reason": stop_reason,
+                "optimizer": optimizer,
+                "best_value": best_value,
+                "best_params": best_params,
+                "cnt": cnt,
+                "progress": progress,
+                "in_flight": [pending.population for pending in in_flight],
+                "in_flight_predicted": [pending.predicted for pending in in_flight],
+                "random_state": rng.get_state(),
+                "surrogate": surrogate,
+                "monitor": monitor,
+                "restart_strategy": restart_strategy,
+                "run_log_chunks": None if run_log is None else run_log.chunks,
+            },
+        )
+
+    # With async_generations > 1 the next generations are sampled before the current
+    # one is told, so workers never wait for the slowest candidate. Generations are
+    # still told in order, which keeps runs reproducible for a fixed seed.
+    in_flight = deque()
+    start_generation, converged, stop_reason = 0, False, None
+
+    state = load_checkpoint(checkpoint_path) if resume and checkpoint_path else None
+    if state is not None:
+        optimizer = state["optimizer"]
+        best_value, best_params = state["best_value"], state["best_params"]
+        cnt, progress = state["cnt"], state["progress"]
+        start_generation, converged = state["generation"] + 1, state["converged"]
+        # A converged run is not continued, it reports why it stopped
+        if converged:
+            stop_reason = state.get("stop_reason")
+        rng.set_state(state["random_state"])
+        surrogate = state["surrogate"]
+        monitor = state["monitor"]
+        monitor.reconfigure(stopping)
+        restart_strategy = state["restart_strategy"]
+        # Rows flushed after the checkpoint are logged again by the resumed run
+        if run_log is not None and state.get("run_log_chunks") is not None:
+            run_log.truncate(state["run_log_chunks"])
+        if not converged:
+            for params_list, predicted in zip(
+                state["in_flight"], state["in_flight_predicted"]
             ):
-                values.append(value)
-                pbar.update()
+                submit_generation(params_list, predicted)
+
+    # A run resumed with more iterations than it was started with needs new generations
+    stop_generation = start_generation if converged else iterations
+    while len(in_flight) < min(async_generations, stop_generation - start_generation):
+        submit_generation()
+
+    monitor.start()
+    generation = start_generation - 1
+    for generation in tqdm(range(start_generation, stop_generation)):
+        profiler.switch(generation)
+        pending = in_flight.popleft()
+        populations = [pending]
+        with tqdm(total=optimizer.population_size) as pbar:
+            with timer.stage("wait"):
+                values = told = pending.collect(pbar)
+            if low_fidelity is not None:
+                with timer.stage("refine"):
+                    told, full = refine(pending, pbar)
+                populations.append(full)
+        solved = sum(population.solved for population in populations)
 
-        for params, value in zip(params_list, values):
+        # Surrogate predictions and low fidelity values are told to the optimizer but
+        # never taken as the best value
+        evaluated = ~pending.surrogate
+        full_fidelity = evaluated & (pending.fidelity == 1.0)
+        for params, value in zip(
+            pending.population[full_fidelity], values[full_fidelity]
+        ):
             condition = value > best_value if maximize else value < best_value
             if condition:
                 best_value = value
                 best_params = params
                 cnt += 1
 
-            solutions.append((params, value))
+        solutions = list(zip(pending.population, told))
+
+        if surrogate is not None:
+            surrogate.add(
+                pending.population[full_fidelity],
+                values[full_fidelity],
+                skipped=int(pending.surrogate.sum()),
+            )
 
+        if run_log is not None:
+            with timer.stage("log"):
+                run_log.append(
+                    generation=np.full(evaluated.sum(), generation),
+                    seed=np.full(evaluated.sum(), seed),
+                    params=pending.population[evaluated],
+                    objective=values[evaluated],
+                    scattering=np.array(
+                        [pending.scattering[i] for i in np.flatnonzero(evaluated)]
+                    ),
+                    eval_time=pending.eval_time[evaluated],
+                    cached=pending.cached[evaluated],
+                    fidelity=pending.fidelity[evaluated],
+                )
+
+        values = values[full_fidelity]
         progress.append(-np.around(np.mean(values), 15))
-        if check_convergence(progress):
-            break
+        stop_reason = monitor.update(
+            np.mean(values), best_value, solved, optimizer.sigma
+        )
 
         pbar.set_description(
             "Processed %s generation\t max %s mean %s"
             % (generation, np.around(best_value, 15), -np.around(np.mean(values), 15))
         )
 
-        optimizer.tell(solutions)
+        with timer.stage("tell"):
+            optimizer.tell(solutions)
+
+        if restart_strategy is not None:
+            restart_strategy.record(solved)
+            if stop_reason is None and optimizer.should_stop():
+                stop_reason = "optimizer"
+            can_restart = not (
+                restart_strategy.exhausted
+                or monitor.budget_exhausted
+                or generation + 1 >= iterations
+            )
+            if stop_reason is not None and can_restart:
+                with timer.stage("restart"):
+                    optimizer = restart(generation, stop_reason)
+                stop_reason = None
+
+        if stop_reason is None:
+            while (
+                len(in_flight) < async_generations
+                and generation + len(in_flight) + 1 < iterations
+            ):
+                submit_generation()
+
+            if (generation + 1) % checkpoint_every == 0:
+                with timer.stage("checkpoint"):
+                    make_checkpoint(generation)
+
+        report.add(generation, timer.pop(), populations)
+        if stop_reason is not None:
+            # A run stopped by a budget keeps its in-flight generations for resuming
+            converged = not monitor.budget_exhausted
+            if converged:
+                in_flight.clear()
+            break
 
-    pool.close()
-    pool.join()
-    ray.shutdown()
+    profiler.stop()
+    make_checkpoint(generation, converged, stop_reason)
+
+    if owns_evaluator:
+        evaluator.shutdown()
 
     if plot_progress:
         plt.plot(progress, marker=".", linestyle=":")
@@ -133,5 +539,18 @@ def cma_optimize(
         "params": best_params,
         "optimized_value": -best_value,
         "progress": progress,
+        "stop_reason": stop_reason or "iterations",
+        "evaluations": monitor.evaluations,
+        "timings": {**report.summary(), "generations": report.generations},
     }
+    if cache is not None:
+        results["cache"] = cache.stats
+    if surrogate is not None:
+        results["surrogate"] = surrogate.stats
+    if restart_strategy is not None:
+        results["restarts"] = restart_strategy.history
     return results
+
+
+# Kept for backward compatibility, the CMA-ES backend is the default one
+cma_optimize = optimize
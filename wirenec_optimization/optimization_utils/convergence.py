@@ -0,0 +1,287 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+
+
+class RunningSlope:
+    """
+    Least squares slope of the last `window` values, updated in O(1) with running
+    sums over a ring buffer.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.count = 0
+
+        self._values = np.zeros(window)
+        self._sum_x = self._sum_xx = self._sum_y = self._sum_xy = 0.0
+
+    def add(self, value: float):
+        x = float(self.count)
+        if self.count >= self.window:
+            old_x, old_y = x - self.window, self._values[self.count % self.window]
+            self._sum_x -= old_x
+            self._sum_xx -= old_x**2
+            self._sum_y -= old_y
+            self._sum_xy -= old_x * old_y
+
+        self._values[self.count % self.window] = value
+        self._sum_x += x
+        self._sum_xx += x**2
+        self._sum_y += value
+        self._sum_xy += x * value
+        self.count += 1
+
+    @property
+    def slope(self) -> float:
+        n = min(self.count, self.window)
+        denominator = n * self._sum_xx - self._sum_x**2
+        if n < 2 or denominator == 0:
+            return np.nan
+        return (n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+
+
+class StoppingCriterion(ABC):
+    name = "base"
+    # Budget criteria stop a run without marking it converged, so it can be resumed
+    # with a larger budget
+    budget = False
+
+    @abstractmethod
+    def update(self, monitor: "ConvergenceMonitor") -> bool:
+        """
+        Called once per generation after the monitor state is updated, returns True
+        if the run should stop.
+        """
+        pass
+
+
+class SlopeCriterion(StoppingCriterion):
+    """
+    Mean value of the generations is flat over both the long and the short window.
+    """
+
+    name = "slope"
+
+    def __init__(self, window: int = 100, short_window: int = 3, tol: float = 1e-8):
+        self.tol = tol
+        self._long = RunningSlope(window)
+        self._short = RunningSlope(short_window)
+
+    def update(self, monitor: "ConvergenceMonitor") -> bool:
+        self._long.add(monitor.mean_value)
+        self._short.add(monitor.mean_value)
+        return (
+            self._long.count > self._long.window
+            and abs(self._long.slope) <= self.tol
+            and abs(self._short.slope) <= self.tol
+        )
+
+
+class StagnationCriterion(StoppingCriterion):
+    """
+    Best value has not improved by more than tol for `patience` generations.
+    """
+
+    name = "stagnation"
+
+    def __init__(self, patience: int = 50, tol: float = 0.0):
+        self.patience = patience
+        self.tol = tol
+        self._best = None
+        self._best_generation = 0
+
+    def update(self, monitor: "ConvergenceMonitor") -> bool:
+        best_value = monitor.best_value
+        if self._best is None or monitor.is_better(best_value, self._best, self.tol):
+            self._best = best_value
+            self._best_generation = monitor.generation
+        return monitor.generation - self._best_generation >= self.patience
+
+
+class SigmaCriterion(StoppingCriterion):
+    name = "sigma"
+
+    def __init__(self, min_sigma: float = 1e-8):
+        self.min_sigma = min_sigma
+
+    def update(self, monitor: "ConvergenceMonitor") -> bool:
+        return monitor.sigma is not None and monitor.sigma < self.min_sigma
+
+
+class WallClockCriterion(StoppingCriterion):
+    """
+    Wall clock time since the run was started or resumed exceeded the budget.
+    """
+
+    name = "wall_clock"
+    budget = True
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def update(self, monitor: "ConvergenceMonitor") -> bool:
+        return monitor.elapsed >= self.seconds
+
+
+class EvaluationBudgetCriterion(StoppingCriterion):
+    name = "evaluations"
+    budget = True
+
+    def __init__(self, max_evaluations: int):
+        self.max_evaluations = max_evaluations
+
+    def update(self, monitor: "ConvergenceMonitor") -> bool:
+        return monitor.evaluations >= self.max_evaluations
+
+
+class TargetCriterion(StoppingCriterion):
+    """
+    Best objective value (as returned by the objective function) reached the target.
+    """
+
+    name = "target"
+
+    def __init__(self, value: float):
+        self.value = value
+
+    def update(self, monitor: "ConvergenceMonitor") -> bool:
+        return not monitor.is_better(self.value, monitor.best_value)
+
+
+STOPPING_CRITERIA = {
+    criterion.name: criterion
+    for criterion in (
+        SlopeCriterion,
+        StagnationCriterion,
+        SigmaCriterion,
+        WallClockCriterion,
+        EvaluationBudgetCriterion,
+        TargetCriterion,
+    )
+}
+
+DEFAULT_STOPPING = {"slope": {}}
+
+
+class ConvergenceMonitor:
+    """
+    Tracks the state of a run generation by generation and evaluates the stopping
+    criteria. stop_reason is the name of the criterion that fired first.
+    """
+
+    def __init__(self, criteria: dict, maximize: bool = False):
+        self.criteria = criteria
+        self.maximize = maximize
+        self.config = {}
+
+        self.generation = 0
+        self.evaluations = 0
+        self.elapsed = 0.0
+        self.mean_value = np.nan
+        self.best_value = np.nan
+        self.sigma = None
+        self.stop_reason = None
+
+        self._last_time = None
+
+    @classmethod
+    def from_config(
+        cls, config: Optional[dict] = None, maximize: bool = False
+    ) -> "ConvergenceMonitor":
+        """
+        Criteria from a mapping of criterion names to their keyword arguments, e.g.
+        {"stagnation": {"patience": 50}, "wall_clock": {"seconds": 7200}}. Without a
+        config only the slope criterion is used.
+        """
+        monitor = cls({}, maximize)
+        monitor.reconfigure(config)
+        return monitor
+
+    def reconfigure(self, config: Optional[dict] = None):
+        """
+        Replaces the criteria, criteria with unchanged arguments keep their state.
+        """
+        if config is None:
+            config = DEFAULT_STOPPING
+        config = {name: dict(kwargs or {}) for name, kwargs in config.items()}
+
+        criteria = {}
+        for name, kwargs in config.items():
+            if name not in STOPPING_CRITERIA:
+                raise ValueError(
+                    f"Unknown stopping criterion {name}, "
+                    f"use one of {list(STOPPING_CRITERIA)}"
+                )
+            if self.config.get(name) == kwargs:
+                criteria[name] = self.criteria[name]
+            else:
+                criteria[name] = STOPPING_CRITERIA[name](**kwargs)
+
+        self.criteria, self.config = criteria, config
+
+    @property
+    def budget_exhausted(self) -> bool:
+        return self.stop_reason is not None and self.criteria[self.stop_reason].budget
+
+    def restart(self):
+        """
+        Resets the convergence criteria for a restarted optimizer, budget criteria keep
+        counting the whole run.
+        """
+        self.criteria = {
+            name: (
+                criterion
+                if criterion.budget
+                else STOPPING_CRITERIA[name](**self.config[name])
+            )
+            for name, criterion in self.criteria.items()
+        }
+        self.stop_reason = None
+
+    def is_better(self, value: float, reference: float, tol: float = 0.0) -> bool:
+        if self.maximize:
+            return value > reference + tol
+        return value < reference - tol
+
+    def start(self):
+        """
+        Starts the wall clock, also after the monitor is restored from a checkpoint.
+        """
+        self.elapsed = 0.0
+        self.stop_reason = None
+        self._last_time = time.perf_counter()
+
+    def update(
+        self,
+        mean_value: float,
+        best_value: float,
+        evaluations: int = 0,
+        sigma: Optional[float] = None,
+    ) -> Optional[str]:
+        if self._last_time is None:
+            self.start()
+        now = time.perf_counter()
+        self.elapsed += now - self._last_time
+        self._last_time = now
+
+        self.generation += 1
+        self.evaluations += evaluations
+        self.mean_value = mean_value
+        self.best_value = best_value
+        self.sigma = sigma
+
+        # Every criterion is updated so that their running state stays consistent
+        fired = [
+            name for name, criterion in self.criteria.items() if criterion.update(self)
+        ]
+        if fired and self.stop_reason is None:
+            self.stop_reason = fired[0]
+        return self.stop_reason
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_last_time"] = None
+        return state
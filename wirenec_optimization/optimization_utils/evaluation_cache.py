@@ -0,0 +1,85 @@
+import hashlib
+import shelve
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from wirenec_optimization.parametrization.base_parametrization import (
+    BaseStructureParametrization,
+)
+
+
+class EvaluationCache:
+    def __init__(
+        self, maxsize: int = 10_000, path: Optional[str] = None, precision: float = 1e-7
+    ):
+        self.maxsize = maxsize
+        self.precision = precision
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._disk = shelve.open(path) if path else None
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def key(
+        self,
+        parametrization: BaseStructureParametrization,
+        params: np.ndarray,
+        *context,
+    ) -> str:
+        """
+        Hash of the decoded geometry quantized to the cache precision and of the
+        evaluation context (frequencies, angles, etc.).
+        """
+        wires = parametrization.get_wire_arrays(params)
+        digest = hashlib.blake2b(digest_size=16)
+        for array in (wires.p1, wires.p2, wires.radius):
+            digest.update(np.around(array / self.precision).astype(np.int64).tobytes())
+        digest.update(wires.segments.astype(np.int64).tobytes())
+        digest.update(repr(context).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[float]:
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[float]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        if self._disk is not None and key in self._disk:
+            self.hits += 1
+            value = self._disk[key]
+            self._remember(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: float):
+        with self._lock:
+            self._remember(key, value)
+            if self._disk is not None:
+                self._disk[key] = value
+
+    def _remember(self, key: str, value: float):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
@@ -0,0 +1,261 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing import resource_tracker
+from multiprocessing.pool import ThreadPool
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+BACKENDS = ("process", "thread", "ray")
+
+# Objective installed once per worker process by the pool initializer, so that
+# only parameter vectors are sent with each task.
+_worker_objective: Optional[Callable] = None
+
+
+def _install_objective(objective: Callable):
+    global _worker_objective
+    _worker_objective = objective
+
+
+def _evaluate_installed(params: np.ndarray, **kwargs):
+    return _worker_objective(params, **kwargs)
+
+
+def _timed_call(objective: Callable, params: np.ndarray, **kwargs) -> tuple:
+    start = time.perf_counter()
+    result = objective(params, **kwargs)
+    elapsed = time.perf_counter() - start
+    # The native thread id identifies both worker processes and pool threads, the
+    # completion time is taken from the system clock shared by all workers
+    return result, elapsed, threading.get_native_id(), time.time()
+
+
+def _evaluate_installed_timed(params: np.ndarray, **kwargs) -> tuple:
+    return _timed_call(_worker_objective, params, **kwargs)
+
+
+# Shared population buffers attached by a worker, keyed by their name. Only the
+# most recent ones are kept, older generations are already evaluated.
+_worker_buffers = OrderedDict()
+_WORKER_BUFFERS_LIMIT = 8
+
+
+def _shared_row(name: str, shape: tuple, row: int) -> np.ndarray:
+    if name not in _worker_buffers:
+        buffer = SharedMemory(name=name)
+        population = np.ndarray(shape, dtype=float, buffer=buffer.buf)
+        population.flags.writeable = False
+        _worker_buffers[name] = buffer, population
+
+        while len(_worker_buffers) > _WORKER_BUFFERS_LIMIT:
+            _, (old_buffer, _) = _worker_buffers.popitem(last=False)
+            old_buffer.close()
+
+    return _worker_buffers[name][1][row]
+
+
+def _evaluate_shared(func: Callable, task: tuple):
+    return func(_shared_row(*task))
+
+
+class SharedPopulation:
+    """
+    Population matrix in shared memory, workers read candidates by row index instead
+    of receiving pickled parameter vectors.
+    """
+
+    def __init__(self, population: np.ndarray):
+        self.shape = population.shape
+        self.buffer = SharedMemory(create=True, size=max(1, population.nbytes))
+        np.ndarray(self.shape, dtype=float, buffer=self.buffer.buf)[:] = population
+
+    def tasks(self) -> list:
+        return [(self.buffer.name, self.shape, row) for row in range(self.shape[0])]
+
+    def close(self):
+        self.buffer.close()
+        self.buffer.unlink()
+
+
+class _SharedResults:
+    """
+    Iterator over the results of a shared population that releases the population
+    once all results are received or the iterator is dropped.
+    """
+
+    def __init__(self, results: Iterator, release: Callable):
+        self._results = results
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._results)
+        except StopIteration:
+            self._release()
+            raise
+
+    def __del__(self):
+        self._release()
+
+
+class ParallelEvaluator:
+    def __init__(
+        self,
+        backend: str = "process",
+        num_workers: Optional[int] = None,
+        shared_memory: bool = False,
+        start_method: Optional[str] = None,
+    ):
+        """
+        shared_memory: with the process backend, populations are passed to the workers
+        through shared memory.
+        start_method: multiprocessing start method of the process backend, the platform
+        default if None. Pools created from threads should use "spawn" or "forkserver",
+        forking a process while another thread holds a lock can deadlock the worker.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown evaluator backend {backend}, use one of {BACKENDS}"
+            )
+
+        self.backend = backend
+        self.num_workers = num_workers or os.cpu_count()
+        self.shared_memory = shared_memory and backend == "process"
+        self.start_method = start_method
+        self._shared_populations = set()
+        self._pool = None
+        self._objective = None
+        self._objective_digest = None
+        self._owns_ray = False
+
+    def set_objective(self, objective: Callable):
+        digest = hashlib.sha1(pickle.dumps(objective)).hexdigest()
+        if digest == self._objective_digest:
+            return
+
+        # Workers only receive the objective at startup, so a new one needs new workers
+        if self.backend != "thread":
+            self._close_pool()
+        self._objective = objective
+        self._objective_digest = digest
+
+    def _start(self):
+        if self._objective is None:
+            raise RuntimeError("Objective is not set, call set_objective first")
+
+        if self.backend == "process":
+            # Workers attaching shared populations register them with the resource
+            # tracker. Started before the pool, the tracker of the driver is inherited
+            # by the workers with every start method, so it is not a tracker of their
+            # own that would unlink the buffers when a worker exits.
+            if self.shared_memory:
+                resource_tracker.ensure_running()
+            self._pool = multiprocessing.get_context(self.start_method).Pool(
+                processes=self.num_workers,
+                initializer=_install_objective,
+                initargs=(self._objective,),
+            )
+        elif self.backend == "thread":
+            self._pool = ThreadPool(processes=self.num_workers)
+        else:
+            import ray
+            from ray.util.multiprocessing import Pool
+
+            # Several evaluators may share one Ray runtime, only its creator shuts it
+            # down
+            if not ray.is_initialized():
+                ray.init(num_cpus=self.num_workers)
+                self._owns_ray = True
+            self._pool = Pool(
+                processes=self.num_workers,
+                initializer=_install_objective,
+                initargs=(self._objective,),
+            )
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._start()
+        return self._pool
+
+    def _chunksize(self, size: int) -> int:
+        return max(1, size // (4 * self.num_workers))
+
+    def imap(self, population: np.ndarray, timed: bool = False, **kwargs) -> Iterator:
+        """
+        Lazily evaluates the rows of the population in order. With timed=True yields
+        (result, evaluation time in seconds, worker id, time.time() at completion)
+        tuples. Keyword arguments are
+        passed to the objective with every call, e.g. the fidelity of the evaluation.
+        """
+        population = np.ascontiguousarray(population, dtype=float)
+        pool = self.pool
+        if self.backend == "thread":
+            func = (
+                partial(_timed_call, self._objective, **kwargs)
+                if timed
+                else partial(self._objective, **kwargs)
+            )
+            return pool.imap(func, population)
+
+        func = partial(
+            _evaluate_installed_timed if timed else _evaluate_installed, **kwargs
+        )
+        if self.shared_memory:
+            return self._imap_shared(func, population)
+        return pool.imap(func, population, chunksize=self._chunksize(len(population)))
+
+    def _imap_shared(self, func: Callable, population: np.ndarray) -> Iterator:
+        shared = SharedPopulation(population)
+        self._shared_populations.add(shared)
+        results = self.pool.imap(
+            partial(_evaluate_shared, func),
+            shared.tasks(),
+            chunksize=self._chunksize(len(population)),
+        )
+
+        return _SharedResults(results, partial(self._release, shared))
+
+    def _release(self, shared: SharedPopulation):
+        if shared in self._shared_populations:
+            self._shared_populations.discard(shared)
+            shared.close()
+
+    def evaluate(self, population: np.ndarray) -> np.ndarray:
+        return np.array(list(self.imap(population)))
+
+    def _close_pool(self):
+        if self._pool is None:
+            return
+
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def shutdown(self):
+        self._close_pool()
+        for shared in list(self._shared_populations):
+            self._release(shared)
+
+        if self._owns_ray:
+            import ray
+
+            ray.shutdown()
+            self._owns_ray = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
@@ -0,0 +1,166 @@
+import cProfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+class StageTimer:
+    """
+    Accumulates wall time of the named stages of the optimization loop.
+    """
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def pop(self) -> dict:
+        stages, self.stages = dict(self.stages), defaultdict(float)
+        return stages
+
+
+def straggler_stats(eval_time: np.ndarray, arrival: np.ndarray) -> dict:
+    """
+    Spread of the evaluation times of a generation and the time between the arrival
+    of the median and the last result, i.e. how long the pool waits for stragglers.
+    """
+    if not len(eval_time):
+        return {"median": 0.0, "max": 0.0, "max_to_median": 0.0, "tail": 0.0}
+
+    median = float(np.median(eval_time))
+    return {
+        "median": median,
+        "max": float(eval_time.max()),
+        "max_to_median": float(eval_time.max() / median) if median > 0 else 0.0,
+        "tail": float(arrival.max() - np.median(arrival)),
+    }
+
+
+class TimingReport:
+    """
+    Per-generation timing statistics of a run. Each generation is passed to the
+    callbacks as a dict, summary() aggregates the whole run.
+    """
+
+    def __init__(self, callbacks: Optional[list] = None):
+        self.callbacks = callbacks or []
+        self.generations = []
+        self._started_at = time.perf_counter()
+
+    def add(self, generation: int, stages: dict, populations: list) -> dict:
+        """
+        Statistics of a generation from the driver stage times and the populations
+        evaluated for it (e.g. low and full fidelity).
+        """
+        solved = [population.worker >= 0 for population in populations]
+        worker, eval_time, build_time, solve_time, arrival = (
+            np.concatenate(
+                [getattr(p, name)[mask] for p, mask in zip(populations, solved)]
+            )
+            for name in ("worker", "eval_time", "build_time", "solve_time", "arrival")
+        )
+        # The generation occupies the pool from its first start to its last finish in
+        # the workers, with async generations it may be dispatched much earlier
+        started = arrival - eval_time
+        wall = float(arrival.max() - started.min()) if len(arrival) else 0.0
+        busy = defaultdict(float)
+        for worker_id, elapsed in zip(worker.tolist(), eval_time.tolist()):
+            busy[worker_id] += elapsed
+
+        stats = {
+            "generation": generation,
+            "stages": stages,
+            "solved": len(eval_time),
+            "wall": wall,
+            "worker": {
+                "build": float(build_time.sum()),
+                "solve": float(solve_time.sum()),
+                "overhead": float((eval_time - build_time - solve_time).sum()),
+            },
+            "busy": dict(busy),
+            "utilization": {
+                worker_id: elapsed / wall if wall > 0 else 0.0
+                for worker_id, elapsed in busy.items()
+            },
+            "stragglers": straggler_stats(eval_time, arrival),
+        }
+        self.generations.append(stats)
+        for callback in self.callbacks:
+            callback(stats)
+        return stats
+
+    def summary(self) -> dict:
+        total = time.perf_counter() - self._started_at
+
+        stages, worker_stages, busy = (defaultdict(float) for _ in range(3))
+        for stats in self.generations:
+            for name, elapsed in stats["stages"].items():
+                stages[name] += elapsed
+            for name, elapsed in stats["worker"].items():
+                worker_stages[name] += elapsed
+            for worker_id, elapsed in stats["busy"].items():
+                busy[worker_id] += elapsed
+
+        max_to_median = [s["stragglers"]["max_to_median"] for s in self.generations]
+        tail = [s["stragglers"]["tail"] for s in self.generations]
+        return {
+            "total": total,
+            "stages": dict(stages),
+            "worker": dict(worker_stages),
+            # Keys are strings so that the summary can be saved as JSON
+            "utilization": {
+                str(worker_id): elapsed / total for worker_id, elapsed in busy.items()
+            },
+            "stragglers": {
+                "mean_max_to_median": float(np.mean(max_to_median or [0.0])),
+                "mean_tail": float(np.mean(tail or [0.0])),
+                "total_tail": float(np.sum(tail)),
+            },
+        }
+
+
+class GenerationProfiler:
+    """
+    Profiles the selected generations of the optimization loop with cProfile and
+    dumps the stats to profile_dir/generation_<n>.prof. Only the driver process is
+    profiled, the solver calls in the workers are not.
+    """
+
+    def __init__(self, generations: tuple = (), profile_dir: Optional[str] = None):
+        self.generations = set(generations)
+        self.profile_dir = Path(profile_dir or ".")
+
+        self._profiler = None
+        self._generation = None
+
+    def switch(self, generation: int):
+        """
+        Stops profiling of the previous generation and starts the given one if it is
+        selected.
+        """
+        self.stop()
+        if generation in self.generations:
+            self._profiler = cProfile.Profile()
+            self._generation = generation
+            self._profiler.enable()
+
+    def stop(self):
+        if self._profiler is None:
+            return
+
+        self._profiler.disable()
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self._profiler.dump_stats(
+            str(self.profile_dir / f"generation_{self._generation}.prof")
+        )
+        self._profiler = None
@@ -0,0 +1,449 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from cmaes import CMA, CMAwM, SepCMA
+
+
+class AskTellOptimizer(ABC):
+    """
+    Optimization algorithm driven by the optimization loop: candidates of a generation
+    are asked one by one and told back in the same order as (params, value) pairs,
+    smaller values are better. Generations are told in the order they were asked, with
+    async generations the next ones are asked before the current one is told. steps
+    are the discretization steps of the genes (0 for continuous genes), backends that
+    do not handle discrete genes leave them to the rounding of the parametrization.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        mean: np.ndarray,
+        sigma: float,
+        seed: int,
+        population_size: int,
+        cov: Optional[np.ndarray] = None,
+        steps: Optional[np.ndarray] = None,
+    ):
+        pass
+
+    @property
+    def sigma(self) -> Optional[float]:
+        """
+        Step size used by the sigma stopping criterion, None if there is none.
+        """
+        return None
+
+    @abstractmethod
+    def ask(self) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def tell(self, solutions: list[tuple[np.ndarray, float]]):
+        pass
+
+    def should_stop(self) -> bool:
+        return False
+
+
+class CMAOptimizer(AskTellOptimizer):
+    """
+    CMA-ES with the full covariance matrix, its cost per generation grows
+    quadratically with the number of genes.
+    """
+
+    name = "cma"
+
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        mean: np.ndarray,
+        sigma: float,
+        seed: int,
+        population_size: int,
+        cov: Optional[np.ndarray] = None,
+        steps: Optional[np.ndarray] = None,
+    ):
+        self._optimizer = CMA(
+            mean=mean,
+            sigma=sigma,
+            bounds=bounds,
+            seed=seed,
+            population_size=population_size,
+            cov=cov,
+        )
+
+    @property
+    def population_size(self) -> int:
+        return self._optimizer.population_size
+
+    @property
+    def sigma(self) -> float:
+        return self._optimizer._sigma
+
+    def ask(self) -> np.ndarray:
+        return self._optimizer.ask()
+
+    def tell(self, solutions: list[tuple[np.ndarray, float]]):
+        self._optimizer.tell(solutions)
+
+    def should_stop(self) -> bool:
+        return self._optimizer.should_stop()
+
+    @property
+    def _rng(self) -> np.random.RandomState:
+        return self._optimizer._rng
+
+    def __getstate__(self):
+        # cmaes does not pickle the sampling RNG of the optimizer
+        state = self.__dict__.copy()
+        state["_random_state"] = self._rng.get_state()
+        return state
+
+    def __setstate__(self, state: dict):
+        random_state = state.pop("_random_state")
+        self.__dict__.update(state)
+        self._rng.set_state(random_state)
+
+
+class SepCMAOptimizer(CMAOptimizer):
+    """
+    CMA-ES with a diagonal covariance matrix, its cost per generation grows linearly
+    with the number of genes, which suits large spatial grids. The covariance of a
+    warm start is not used.
+    """
+
+    name = "sep_cma"
+
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        mean: np.ndarray,
+        sigma: float,
+        seed: int,
+        population_size: int,
+        cov: Optional[np.ndarray] = None,
+        steps: Optional[np.ndarray] = None,
+    ):
+        self._optimizer = SepCMA(
+            mean=mean,
+            sigma=sigma,
+            bounds=bounds,
+            seed=seed,
+            population_size=population_size,
+        )
+
+
+class CMAwMOptimizer(CMAOptimizer):
+    """
+    CMA-ES with margin: discrete genes are sampled on their grid of steps, and the
+    margin keeps their marginal probabilities from collapsing, so that the search does
+    not get stuck on one value of a discrete gene. The optimizer is told the
+    continuous samples behind the discretized candidates it returned.
+    """
+
+    name = "cma_wm"
+
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        mean: np.ndarray,
+        sigma: float,
+        seed: int,
+        population_size: int,
+        cov: Optional[np.ndarray] = None,
+        steps: Optional[np.ndarray] = None,
+        margin: Optional[float] = None,
+    ):
+        self._optimizer = CMAwM(
+            mean=mean,
+            sigma=sigma,
+            bounds=bounds,
+            steps=np.zeros(len(bounds)) if steps is None else steps,
+            seed=seed,
+            population_size=population_size,
+            cov=cov,
+            margin=margin,
+        )
+        self._tell_params = deque()
+
+    @property
+    def _state(self):
+        # Newer cmaes releases keep the CMA-ES state of CMAwM in a wrapped CMA
+        return getattr(self._optimizer, "_cma", self._optimizer)
+
+    @property
+    def sigma(self) -> float:
+        return self._state._sigma
+
+    @property
+    def _rng(self) -> np.random.RandomState:
+        return self._state._rng
+
+    def ask(self) -> np.ndarray:
+        params, tell_params = self._optimizer.ask()
+        self._tell_params.append(tell_params)
+        return params
+
+    def tell(self, solutions: list[tuple[np.ndarray, float]]):
+        self._optimizer.tell(
+            [(self._tell_params.popleft(), value) for _, value in solutions]
+        )
+
+
+class DifferentialEvolution(AskTellOptimizer):
+    """
+    Differential evolution with binomial crossover and greedy selection: the i-th
+    candidate of a generation is the trial vector of the i-th member of the population.
+    The mean is the first member of the initial population, sigma is not used.
+    Discrete genes are rounded to their steps.
+    """
+
+    name = "de"
+    strategies = ("rand1", "best1")
+
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        mean: np.ndarray,
+        sigma: float,
+        seed: int,
+        population_size: int,
+        cov: Optional[np.ndarray] = None,
+        steps: Optional[np.ndarray] = None,
+        mutation: float = 0.8,
+        crossover: float = 0.9,
+        strategy: str = "rand1",
+    ):
+        if strategy not in self.strategies:
+            raise ValueError(
+                f"Unknown differential evolution strategy {strategy}, "
+                f"use one of {self.strategies}"
+            )
+
+        self.bounds = bounds
+        self.population_size = max(4, population_size)
+        self.mutation = mutation
+        self.crossover = crossover
+        self.strategy = strategy
+        self.steps = np.zeros(len(bounds)) if steps is None else steps
+
+        self._rng = np.random.RandomState(seed)
+        lower_bounds, upper_bounds = bounds[:, 0], bounds[:, 1]
+        self._population = lower_bounds + self._rng.rand(
+            self.population_size, len(bounds)
+        ) * (upper_bounds - lower_bounds)
+        self._population[0] = np.clip(mean, lower_bounds, upper_bounds)
+        self._population = self._discretize(self._population)
+        self._fitness = np.full(self.population_size, np.inf)
+        self._asked = 0
+
+    def ask(self) -> np.ndarray:
+        i = self._asked % self.population_size
+        self._asked += 1
+        # The first generation evaluates the initial population
+        if self._asked <= self.population_size:
+            return self._population[i].copy()
+
+        others = np.delete(np.arange(self.population_size), i)
+        if self.strategy == "best1":
+            base = self._population[np.argmin(self._fitness)]
+            r1, r2 = self._rng.choice(others, 2, replace=False)
+        else:
+            r0, r1, r2 = self._rng.choice(others, 3, replace=False)
+            base = self._population[r0]
+        mutant = base + self.mutation * (self._population[r1] - self._population[r2])
+
+        cross = self._rng.rand(len(self.bounds)) < self.crossover
+        cross[self._rng.randint(len(self.bounds))] = True
+        trial = np.where(cross, mutant, self._population[i])
+        return self._discretize(np.clip(trial, self.bounds[:, 0], self.bounds[:, 1]))
+
+    def _discretize(self, params: np.ndarray) -> np.ndarray:
+        discrete = self.steps > 0
+        lower_bounds, steps = self.bounds[discrete, 0], self.steps[discrete]
+        params = params.copy()
+        grid_index = np.around((params[..., discrete] - lower_bounds) / steps)
+        params[..., discrete] = lower_bounds + grid_index * steps
+        return params
+
+    def tell(self, solutions: list[tuple[np.ndarray, float]]):
+        for i, (params, value) in enumerate(solutions):
+            if value <= self._fitness[i]:
+                self._population[i] = params
+                self._fitness[i] = value
+
+
+class BayesianOptimizer(AskTellOptimizer):
+    """
+    Gaussian process Bayesian optimization (bayes_opt) with the UCB acquisition. The
+    first candidate of a generation uses kappa, the others draw it from an exponential
+    distribution with mean kappa, so that a generation is not the same point repeated.
+    The cost of a suggestion grows cubically with the number of told candidates, so it
+    suits small structures and evaluation budgets. The mean is the first candidate.
+    """
+
+    name = "bo"
+
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        mean: np.ndarray,
+        sigma: float,
+        seed: int,
+        population_size: int,
+        cov: Optional[np.ndarray] = None,
+        steps: Optional[np.ndarray] = None,
+        kappa: float = 2.576,
+    ):
+        from bayes_opt import BayesianOptimization
+
+        # bayes_opt orders the parameters by name
+        self._names = [f"x{i:05d}" for i in range(len(bounds))]
+        self._optimizer = BayesianOptimization(
+            f=None,
+            pbounds={name: tuple(bound) for name, bound in zip(self._names, bounds)},
+            random_state=seed,
+            verbose=0,
+            allow_duplicate_points=True,
+        )
+        self.population_size = population_size
+        self.kappa = kappa
+        self.mean = mean
+
+        self._rng = np.random.RandomState(seed)
+        self._asked = 0
+
+    def ask(self) -> np.ndarray:
+        from bayes_opt import UtilityFunction
+
+        i = self._asked % self.population_size
+        self._asked += 1
+        if self._asked == 1:
+            return np.array(self.mean, dtype=float)
+
+        kappa = self.kappa if i == 0 else self._rng.exponential(self.kappa)
+        suggestion = self._optimizer.suggest(
+            UtilityFunction(kind="ucb", kappa=kappa, xi=0.0)
+        )
+        return np.array([suggestion[name] for name in self._names])
+
+    def tell(self, solutions: list[tuple[np.ndarray, float]]):
+        for params, value in solutions:
+            # bayes_opt maximizes the target
+            self._optimizer.register(
+                params=dict(zip(self._names, params)), target=-value
+            )
+
+
+OPTIMIZERS = {
+    optimizer.name: optimizer
+    for optimizer in (
+        CMAOptimizer,
+        SepCMAOptimizer,
+        CMAwMOptimizer,
+        DifferentialEvolution,
+        BayesianOptimizer,
+    )
+}
+
+
+def make_optimizer(
+    name: str,
+    bounds: np.ndarray,
+    mean: np.ndarray,
+    sigma: float,
+    seed: int,
+    population_size: int,
+    cov: Optional[np.ndarray] = None,
+    steps: Optional[np.ndarray] = None,
+    **kwargs,
+) -> AskTellOptimizer:
+    if name not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer {name}, use one of {list(OPTIMIZERS)}")
+    return OPTIMIZERS[name](
+        bounds, mean, sigma, seed, population_size, cov, steps, **kwargs
+    )
+
+
+class RestartStrategy:
+    """
+    Restarts of a converged optimizer from a new random mean. IPOP multiplies the
+    population size by increase_popsize on every restart. BIPOP alternates between
+    this large population regime and a small one with a random smaller population
+    size and step size, running the regime that used fewer evaluations so far.
+    """
+
+    strategies = ("ipop", "bipop")
+
+    def __init__(
+        self,
+        population_size: int,
+        sigma: float,
+        strategy: str = "ipop",
+        max_restarts: int = 9,
+        increase_popsize: float = 2,
+    ):
+        if strategy not in self.strategies:
+            raise ValueError(
+                f"Unknown restart strategy {strategy}, use one of {self.strategies}"
+            )
+
+        self.population_size = population_size
+        self.sigma = sigma
+        self.strategy = strategy
+        self.max_restarts = max_restarts
+        self.increase_popsize = increase_popsize
+
+        self.regime = "large"
+        self.evaluations = {"large": 0, "small": 0}
+        self.history = []
+        self._large_restarts = 0
+
+    @property
+    def exhausted(self) -> bool:
+        return len(self.history) >= self.max_restarts
+
+    def record(self, evaluations: int):
+        self.evaluations[self.regime] += evaluations
+
+    def next(
+        self, rng: np.random.RandomState, generation: int, reason: str
+    ) -> tuple[int, float]:
+        """
+        Population size and step size of the next restart.
+        """
+        small_budget_left = self.evaluations["small"] < self.evaluations["large"]
+        if self.strategy == "bipop" and small_budget_left:
+            self.regime = "small"
+            large_size = self.population_size * self.increase_popsize ** (
+                self._large_restarts + 1
+            )
+            u_size, u_sigma = rng.rand(2)
+            population_size = self.population_size * (
+                0.5 * large_size / self.population_size
+            ) ** (u_size**2)
+            sigma = self.sigma * 10 ** (-2 * u_sigma)
+        else:
+            self.regime = "large"
+            self._large_restarts += 1
+            population_size = (
+                self.population_size * self.increase_popsize**self._large_restarts
+            )
+            sigma = self.sigma
+
+        population_size = max(2, int(population_size))
+        self.history.append(
+            {
+                "generation": generation,
+                "reason": reason,
+                "regime": self.regime,
+                "population_size": population_size,
+                "sigma": sigma,
+            }
+        )
+        return population_size, sigma
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+class RunLog:
+    """
+    Append-only columnar log of evaluated candidates. Each column is stored as a
+    sequence of .npy chunks in its own directory, so logs can be read back with
+    memory mapping without loading whole runs.
+    """
+
+    def __init__(self, path: [str, Path], chunk_size: int = 4096):
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+
+        self._buffers = {}
+        self._buffered_rows = 0
+        self._chunk_index = self._next_chunk_index()
+
+    def _next_chunk_index(self) -> int:
+        chunks = list(self.path.glob("*/chunk_*.npy"))
+        if not chunks:
+            return 0
+        return max(int(chunk.stem.split("_")[1]) for chunk in chunks) + 1
+
+    def append(self, **columns: np.ndarray):
+        rows = {len(np.atleast_1d(values)) for values in columns.values()}
+        if len(rows) != 1:
+            raise ValueError("All columns must have the same number of rows")
+
+        for name, values in columns.items():
+            self._buffers.setdefault(name, []).append(np.atleast_1d(values))
+        self._buffered_rows += rows.pop()
+
+        if self._buffered_rows >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered_rows:
+            return
+
+        for name, values in self._buffers.items():
+            column_path = self.path / name
+            column_path.mkdir(parents=True, exist_ok=True)
+
+            chunk_path = column_path / f"chunk_{self._chunk_index:06d}.npy"
+            tmp_path = column_path / f"chunk_{self._chunk_index:06d}.tmp"
+            with open(tmp_path, "wb") as fp:
+                np.save(fp, np.concatenate(values))
+            os.replace(tmp_path, chunk_path)
+
+        self._buffers = {}
+        self._buffered_rows = 0
+        self._chunk_index += 1
+
+    @property
+    def chunks(self) -> int:
+        """
+        Number of chunks written so far.
+        """
+        return self._chunk_index
+
+    def truncate(self, chunks: int):
+        """
+        Drops the buffered rows and the chunks written after the first `chunks`, e.g.
+        the rows logged after the checkpoint a run is resumed from.
+        """
+        for chunk in self.path.glob("*/chunk_*.npy"):
+            if int(chunk.stem.split("_")[1]) >= chunks:
+                chunk.unlink()
+
+        self._buffers = {}
+        self._buffered_rows = 0
+        self._chunk_index = chunks
+
+    def close(self):
+        self.flush()
+
+    @staticmethod
+    def load(
+        path: [str, Path], column: str, mmap_mode: Optional[str] = "r"
+    ) -> list[np.ndarray]:
+        """
+        Chunks of a column in order, memory mapped unless mmap_mode is None.
+        """
+        chunks = sorted((Path(path) / column).glob("chunk_*.npy"))
+        if not chunks:
+            raise FileNotFoundError(f"No chunks of column {column} in {path}")
+
+        return [np.load(chunk, mmap_mode=mmap_mode) for chunk in chunks]
@@ -0,0 +1,27 @@
+import numpy as np
+from wirenec.geometry import Geometry
+from wirenec.scattering import get_scattering_in_frequency_range
+
+
+def scattering_spectra(
+    g: Geometry,
+    freq: [list, tuple, np.ndarray],
+    scattering_angle: [float, tuple, np.ndarray] = (90,),
+    theta: float = 90,
+    eta: float = 90,
+    phi: float = 90,
+) -> np.ndarray:
+    """
+    Scattering for all frequencies and observation angles from a single solve of the
+    geometry per frequency. Returns an array of shape
+    (len(freq), len(scattering_angle)).
+    """
+    freq = np.atleast_1d(freq)
+    angles = np.atleast_1d(scattering_angle)
+
+    scattering, _ = get_scattering_in_frequency_range(
+        g, freq, theta, eta, phi, tuple(angles)
+    )
+    # wirenec solves the frequencies one by one, so they are the leading axis (a single
+    # angle may be squeezed)
+    return np.asarray(scattering, dtype=float).reshape(len(freq), len(angles))
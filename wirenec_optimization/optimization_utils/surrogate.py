@@ -0,0 +1,107 @@
+import math
+from typing import Optional
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+
+
+class RBFSurrogate:
+    """
+    Radial basis function model of the objective trained on the truly evaluated
+    candidates, used to pre-screen populations before they are sent to the solver.
+    max_samples is the number of most recent samples the model is trained on, by
+    default 500 or twice the dim + 1 samples the model needs, whichever is larger.
+    """
+
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        max_samples: Optional[int] = None,
+        smoothing: float = 1e-6,
+        kernel: str = "thin_plate_spline",
+    ):
+        dim = len(bounds)
+        if max_samples is None:
+            max_samples = max(500, 2 * (dim + 1))
+        elif max_samples <= dim + 1:
+            raise ValueError(
+                f"The surrogate needs more than {dim + 1} samples for {dim} genes, "
+                f"got max_samples={max_samples}"
+            )
+
+        self.lower_bounds, self.upper_bounds = bounds[:, 0], bounds[:, 1]
+        self.max_samples = max_samples
+        self.smoothing = smoothing
+        self.kernel = kernel
+
+        self.params = np.empty((0, len(bounds)))
+        self.values = np.empty(0)
+        self._model = None
+
+        self.evaluated = 0
+        self.skipped = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"evaluated": self.evaluated, "skipped": self.skipped}
+
+    def _normalize(self, params: np.ndarray) -> np.ndarray:
+        return (params - self.lower_bounds) / (self.upper_bounds - self.lower_bounds)
+
+    @property
+    def is_ready(self) -> bool:
+        # The linear polynomial term of the interpolant needs dim + 1 points
+        return len(self.values) > self.params.shape[1] + 1
+
+    def add(self, params: np.ndarray, values: np.ndarray, skipped: int = 0):
+        self.evaluated += len(values)
+        self.skipped += skipped
+        self.params = np.concatenate([self.params, params])[-self.max_samples :]
+        self.values = np.concatenate([self.values, values])[-self.max_samples :]
+        self._model = None
+
+    def predict(self, params: np.ndarray) -> np.ndarray:
+        if self._model is None:
+            self._model = RBFInterpolator(
+                self._normalize(self.params),
+                self.values,
+                kernel=self.kernel,
+                smoothing=self.smoothing,
+            )
+        return self._model(self._normalize(params))
+
+    def screen(
+        self,
+        population: np.ndarray,
+        fraction: float,
+        exploration: float,
+        rng: np.random.RandomState,
+    ) -> np.ndarray:
+        """
+        Predicted values for candidates that do not need a real evaluation and NaN
+        for the most promising fraction of the population (to be minimized) plus a
+        few random exploration candidates.
+        """
+        predicted = np.full(len(population), np.nan)
+        if not self.is_ready:
+            return predicted
+
+        try:
+            values = self.predict(population)
+        except np.linalg.LinAlgError:
+            return predicted
+
+        evaluated_count = max(1, math.ceil(fraction * len(population)))
+        exploration_count = min(
+            math.ceil(exploration * evaluated_count), evaluated_count - 1
+        )
+
+        order = np.argsort(values)
+        promising = order[: evaluated_count - exploration_count]
+        rest = order[evaluated_count - exploration_count :]
+        explored = rng.choice(rest, size=exploration_count, replace=False)
+
+        predicted[:] = values
+        predicted[promising] = np.nan
+        predicted[explored] = np.nan
+        return predicted
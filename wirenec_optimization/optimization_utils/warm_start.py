@@ -0,0 +1,70 @@
+import json
+import math
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+def load_warm_start_solutions(
+    path: [str, Path],
+    structure_name: str,
+    parametrization_hyperparams: dict,
+    dim: int,
+    top_k: Optional[int] = None,
+) -> list[tuple[np.ndarray, float]]:
+    """
+    Collects (params, objective value) of previous results saved under path for the
+    same structure and parametrization hyperparameters, best first.
+    """
+    # Hyperparameters are compared in the form they are stored in
+    hyperparams = json.loads(json.dumps(parametrization_hyperparams))
+
+    solutions = []
+    for params_file in sorted(Path(path).rglob("optimized_params.json")):
+        result_path = params_file.parent
+        hyperparams_file = result_path / "parametrization_hyperparams.json"
+        if not result_path.name.startswith(f"{structure_name}__"):
+            continue
+        if not hyperparams_file.exists():
+            continue
+
+        with open(hyperparams_file) as fp:
+            if json.load(fp) != hyperparams:
+                continue
+        with open(params_file) as fp:
+            result = json.load(fp)
+
+        params = np.array(result["params"], dtype=float)
+        if len(params) == dim:
+            solutions.append((params, -result["optimized_value"]))
+
+    solutions.sort(key=lambda solution: solution[1])
+    return solutions[:top_k]
+
+
+def get_warm_start_distribution(
+    solutions: list[tuple[np.ndarray, float]],
+    bounds: np.ndarray,
+    gamma: float = 0.1,
+    alpha: float = 0.1,
+) -> tuple[np.ndarray, float, np.ndarray]:
+    """
+    Mean, step size and covariance of the promising distribution estimated from the
+    best gamma of the solutions, as in cmaes.get_warm_start_mgd. The determinant is
+    taken in log space, it underflows to zero for a few hundred genes.
+    """
+    # At least the best solution is used, however few of them there are
+    count = max(1, math.floor(len(solutions) * gamma))
+    best = sorted(solutions, key=lambda solution: solution[1])[:count]
+    top = np.array([params for params, _ in best], dtype=float)
+
+    dim = top.shape[1]
+    mean = top.mean(axis=0)
+    centered = top - mean
+    sigma_matrix = alpha**2 * np.eye(dim) + centered.T @ centered / count
+
+    _, logdet = np.linalg.slogdet(sigma_matrix)
+    sigma = np.exp(logdet / 2 / dim)
+    cov = sigma_matrix / sigma**2
+    return np.clip(mean, bounds[:, 0], bounds[:, 1]), sigma, cov
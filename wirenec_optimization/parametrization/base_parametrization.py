@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import Tuple
 
+import numpy as np
+
 
 class BaseObjectParametrization(ABC):
     def __init__(self, object_type: str, max_size: float, min_size: float):
@@ -12,6 +14,12 @@ class BaseObjectParametrization(ABC):
     def get_geometry(self, size_ratio: float, orientation: Tuple):
         pass
 
+    @abstractmethod
+    def get_segments(
+        self, size_ratios: np.ndarray, wire_radius: float, fidelity: float = 1.0
+    ):
+        pass
+
 
 class BaseStructureParametrization(ABC):
     def __init__(self, name: str):
@@ -27,6 +35,17 @@ class BaseStructureParametrization(ABC):
     def bounds(self):
         pass
 
+    @property
+    def steps(self) -> np.ndarray:
+        """
+        Discretization step of every gene, 0 for continuous genes.
+        """
+        return np.zeros(len(self.bounds))
+
+    @abstractmethod
+    def get_geometry(self, params, fidelity: float = 1.0):
+        pass
+
     @abstractmethod
-    def get_geometry(self, params):
+    def get_wire_arrays(self, params, fidelity: float = 1.0):
         pass
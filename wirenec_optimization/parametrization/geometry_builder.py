@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+from wirenec.geometry import Geometry, Wire
+
+from wirenec_optimization.parametrization.sample_objects import get_dimensions
+
+
+def _euler_matrices(angles: np.ndarray) -> np.ndarray:
+    alpha, beta, gamma = angles.T
+    ones, zeros = np.ones_like(alpha), np.zeros_like(alpha)
+
+    def stack(rows):
+        return np.stack([np.stack(row, axis=-1) for row in rows], axis=-2)
+
+    rz = stack(
+        [
+            [np.cos(alpha), -np.sin(alpha), zeros],
+            [np.sin(alpha), np.cos(alpha), zeros],
+            [zeros, zeros, ones],
+        ]
+    )
+    ry = stack(
+        [
+            [np.cos(beta), zeros, np.sin(beta)],
+            [zeros, ones, zeros],
+            [-np.sin(beta), zeros, np.cos(beta)],
+        ]
+    )
+    rx = stack(
+        [
+            [ones, zeros, zeros],
+            [zeros, np.cos(gamma), -np.sin(gamma)],
+            [zeros, np.sin(gamma), np.cos(gamma)],
+        ]
+    )
+    return rz @ ry @ rx
+
+
+def _wirenec_matrix(angles: np.ndarray) -> np.ndarray:
+    g = Geometry([Wire((0, 0, 0), axis) for axis in np.eye(3)])
+    g.rotate(*angles)
+    return np.array([w.p2 - w.p1 for w in g.wires]).T
+
+
+@lru_cache(maxsize=None)
+def _matches_wirenec_rotation() -> bool:
+    angles = np.array([0.3, 0.5, 0.7])
+    return np.allclose(_euler_matrices(angles[None])[0], _wirenec_matrix(angles))
+
+
+def rotation_matrices(angles: np.ndarray) -> np.ndarray:
+    angles = np.atleast_2d(np.asarray(angles, dtype=float))
+    if _matches_wirenec_rotation():
+        return _euler_matrices(angles)
+
+    # Slow path in case wirenec changes its rotation convention
+    return np.array([_wirenec_matrix(a) for a in angles])
+
+
+@dataclass
+class WireArrays:
+    p1: np.ndarray
+    p2: np.ndarray
+    radius: np.ndarray
+    segments: np.ndarray
+    cell: np.ndarray
+
+    def translate(self, cell_offsets: np.ndarray) -> "WireArrays":
+        shift = cell_offsets[self.cell]
+        return WireArrays(
+            self.p1 + shift, self.p2 + shift, self.radius, self.segments, self.cell
+        )
+
+    def to_geometry(self) -> Geometry:
+        return Geometry(
+            [
+                Wire(p1, p2, radius, segments=int(segments))
+                for p1, p2, radius, segments in zip(
+                    self.p1, self.p2, self.radius, self.segments
+                )
+            ]
+        )
+
+
+def build_cells(
+    type_mapping: dict,
+    types: np.ndarray,
+    size_ratios: np.ndarray,
+    orientations: np.ndarray,
+    wire_radius: float = 0.5 * 1e-3,
+    fidelity: float = 1.0,
+) -> tuple[WireArrays, np.ndarray]:
+    """
+    Builds rotated unit cells centered at the origin for all cells at once.
+    Returns wires of all cells (in cell order) and the maximal size of each cell.
+    With fidelity below one the cells are discretized coarser.
+    """
+    rotations = rotation_matrices(orientations)
+    dimensions = np.zeros(len(types))
+
+    parts = []
+    for tp, object_parametrization in type_mapping.items():
+        (idx,) = np.nonzero(types == tp)
+        if not len(idx):
+            continue
+
+        p1, p2, radius, segments = object_parametrization().get_segments(
+            size_ratios[idx], wire_radius, fidelity
+        )
+        p1 = np.einsum("nij,nwj->nwi", rotations[idx], p1)
+        p2 = np.einsum("nij,nwj->nwi", rotations[idx], p2)
+
+        dimensions[idx] = get_dimensions(p1, p2)
+
+        wires_count = p1.shape[1]
+        parts.append(
+            (
+                p1.reshape(-1, 3),
+                p2.reshape(-1, 3),
+                radius.reshape(-1),
+                segments.reshape(-1),
+                np.repeat(idx, wires_count),
+            )
+        )
+
+    p1, p2, radius, segments, cell = (np.concatenate(a) for a in zip(*parts))
+    order = np.argsort(cell, kind="stable")
+    wires = WireArrays(
+        p1[order], p2[order], radius[order], segments[order], cell[order]
+    )
+    return wires, dimensions
+
+
+def expand_cells(
+    wires: WireArrays, orbit: np.ndarray, transforms: np.ndarray
+) -> WireArrays:
+    """
+    Wires of every cell from the wires built for the orbits of the cells (cells of
+    the given wires are orbit indices), transformed by the transform of each cell.
+    """
+    counts = np.bincount(wires.cell, minlength=orbit.max() + 1)
+    starts = np.cumsum(counts) - counts
+
+    per_cell = counts[orbit]
+    cell = np.repeat(np.arange(len(orbit)), per_cell)
+    within_cell = np.arange(per_cell.sum()) - np.repeat(
+        np.cumsum(per_cell) - per_cell, per_cell
+    )
+    idx = np.repeat(starts[orbit], per_cell) + within_cell
+
+    rotations = transforms[cell]
+    return WireArrays(
+        np.einsum("nij,nj->ni", rotations, wires.p1[idx]),
+        np.einsum("nij,nj->ni", rotations, wires.p2[idx]),
+        wires.radius[idx],
+        wires.segments[idx],
+        cell,
+    )
@@ -5,17 +5,32 @@ from wirenec.visualization import plot_geometry
 from wirenec_optimization.parametrization.base_parametrization import (
     BaseStructureParametrization,
 )
+from wirenec_optimization.parametrization.geometry_builder import (
+    WireArrays,
+    build_cells,
+    expand_cells,
+)
 from wirenec_optimization.parametrization.sample_objects import (
-    get_geometry_dimensions,
     WireParametrization,
     SRRParametrization,
 )
+from wirenec_optimization.parametrization.symmetry import CellSymmetry
 
 
 class LayersParametrization(BaseStructureParametrization):
     def __init__(
-        self, matrix_size, layers_num, tau, delta, asymmetry_factor: float | None = 0.9
+        self,
+        matrix_size,
+        layers_num,
+        tau,
+        delta,
+        asymmetry_factor: float | None = 0.9,
+        symmetry: dict | None = None,
     ):
+        """
+        symmetry: keyword arguments of CellSymmetry (mirror, rotation, supercell), cells
+        of a layer related by the symmetry share their genes.
+        """
         super().__init__("layers")
 
         self.type_mapping = {0: WireParametrization, 1: SRRParametrization}
@@ -27,84 +42,93 @@ class LayersParametrization(BaseStructureParametrization):
         self.delta = delta
         self.asymmetry_factor = asymmetry_factor
 
+        self.symmetry = symmetry
+        self.cell_orbits = None
+        if symmetry is not None:
+            self.cell_orbits = CellSymmetry(**symmetry).orbits(
+                matrix_size, layers_num, (tau, tau)
+            )
+
     @property
     def optimized_objects_count(self):
+        if self.cell_orbits is not None:
+            return self.cell_orbits[0].max() + 1
         return np.prod(self.matrix_size) * self.layers_num
 
     @property
     def bounds(self) -> np.ndarray:
-        m, n = self.matrix_size
+        cells_count = int(self.optimized_objects_count)
 
-        size_bounds = [(0, 1) for _ in range(n * m)] * self.layers_num
-        orientation_bounds = [(0, 2 * np.pi) for _ in range(n * m)] * self.layers_num
-        types_bounds = [
-            (0, len(self.type_mapping.keys()) - 1) for _ in range(n * m)
-        ] * self.layers_num
+        size_bounds = [(0, 1)] * cells_count
+        orientation_bounds = [(0, 2 * np.pi)] * cells_count
+        types_bounds = [(0, len(self.type_mapping.keys()) - 1)] * cells_count
 
         if self.asymmetry_factor:
-            delta_bounds = [(0, 1) for _ in range(n * m)] * self.layers_num * 2
+            delta_bounds = [(0, 1)] * cells_count * 2
         else:
             delta_bounds = []
 
         return np.array(types_bounds + size_bounds + orientation_bounds + delta_bounds)
 
+    @property
+    def steps(self) -> np.ndarray:
+        # Type genes are integer indices of type_mapping
+        steps = np.zeros(len(self.bounds))
+        steps[: int(self.optimized_objects_count)] = 1
+        return steps
+
     def get_random_geometry(self, seed: int = 42) -> Geometry:
         np.random.seed(seed)
         bounds = self.bounds
         random_parameters = [np.random.uniform(low=mn, high=mx) for (mn, mx) in bounds]
         return self.get_geometry(random_parameters)
 
-    def get_geometry(self, params: [np.ndarray, list]) -> Geometry:
+    def get_cell_positions(self) -> np.ndarray:
         m, n = self.matrix_size
-        split_size = m * n * self.layers_num
-        types_params, size_params, orientation_params = (
-            np.array_split(params[:split_size], self.layers_num),
-            np.array_split(params[split_size : 2 * split_size], self.layers_num),
-            np.array_split(params[2 * split_size : 3 * split_size], self.layers_num),
-        )
-        if self.asymmetry_factor:
-            delta_params = np.array_split(params[3 * split_size :], self.layers_num)
-
-        wires = []
         a_x, a_y = self.tau * n, self.tau * m
         x0, y0 = -a_x / 2 + self.tau / 2, -a_y / 2 + self.tau / 2
 
-        for l in range(self.layers_num):
-            for i in range(m):
-                for j in range(n):
-                    tp, size_ratio, orientation = (
-                        int(np.around(types_params[l].reshape((m, n))[i, j])),
-                        size_params[l].reshape((m, n))[i, j],
-                        orientation_params[l].reshape((m, n))[i, j],
-                    )
-                    orientation = (orientation, 0, 0)
-                    g_tmp = self.type_mapping[tp]().get_geometry(
-                        size_ratio, orientation
-                    )
-
-                    if self.asymmetry_factor:
-                        phi_rel, dr_rel = delta_params[l].reshape((m, n, 2))[i, j]
-                        obj_size_max = get_geometry_dimensions(g_tmp)
-                        phi, dr = (
-                            phi_rel * 2 * np.pi,
-                            (self.tau - obj_size_max)
-                            / 2
-                            * self.asymmetry_factor
-                            * dr_rel,
-                        )
-                        dx, dy = dr * np.cos(phi), dr * np.sin(phi)
-                    else:
-                        dx = dy = 0
-
-                    x, y, z = (
-                        x0 + self.tau * i + dx,
-                        y0 + self.tau * j + dy,
-                        self.delta * l,
-                    )
-                    g_tmp.translate((x, y, z))
-                    wires += g_tmp.wires
-
-        return Geometry(wires)
+        l, i, j = np.meshgrid(
+            np.arange(self.layers_num), np.arange(m), np.arange(n), indexing="ij"
+        )
+        return np.stack(
+            [x0 + self.tau * i, y0 + self.tau * j, self.delta * l], axis=-1
+        ).reshape(-1, 3)
+
+    def get_wire_arrays(
+        self, params: [np.ndarray, list], fidelity: float = 1.0
+    ) -> WireArrays:
+        params = np.asarray(params, dtype=float)
+        cells_count = int(self.optimized_objects_count)
+
+        types = np.around(params[:cells_count]).astype(int)
+        size_ratios = params[cells_count : 2 * cells_count]
+        orientations = np.zeros((cells_count, 3))
+        orientations[:, 0] = params[2 * cells_count : 3 * cells_count]
+
+        wires, obj_size_max = build_cells(
+            self.type_mapping, types, size_ratios, orientations, fidelity=fidelity
+        )
+
+        shifts = np.zeros((cells_count, 3))
+        if self.asymmetry_factor:
+            phi_rel, dr_rel = params[3 * cells_count :].reshape(cells_count, 2).T
+            phi = phi_rel * 2 * np.pi
+            dr = (self.tau - obj_size_max) / 2 * self.asymmetry_factor * dr_rel
+            shifts[:, 0] = dr * np.cos(phi)
+            shifts[:, 1] = dr * np.sin(phi)
+
+        if self.cell_orbits is None:
+            return wires.translate(self.get_cell_positions() + shifts)
+
+        # Objects are built once per orbit and mapped to all of its cells
+        wires = expand_cells(wires.translate(shifts), *self.cell_orbits)
+        return wires.translate(self.get_cell_positions())
+
+    def get_geometry(
+        self, params: [np.ndarray, list], fidelity: float = 1.0
+    ) -> Geometry:
+        return self.get_wire_arrays(params, fidelity).to_geometry()
 
 
 if __name__ == "__main__":
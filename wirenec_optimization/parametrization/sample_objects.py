@@ -7,15 +7,41 @@ from wirenec_optimization.parametrization.base_parametrization import (
     BaseObjectParametrization,
 )
 
+# Canonical unit-cell shapes keyed by (object type, number of wires, wire radius)
+_shape_templates = {}
+
+
+def get_dimensions(p1: np.ndarray, p2: np.ndarray) -> np.ndarray:
+    points = np.concatenate([p1, p2], axis=-2)
+    return np.ptp(points, axis=-2).max(axis=-1)
+
+
+def geometry_to_arrays(geom: Geometry):
+    p1 = np.array([w.p1 for w in geom.wires], dtype=float)
+    p2 = np.array([w.p2 for w in geom.wires], dtype=float)
+    radius = np.array([w.radius for w in geom.wires], dtype=float)
+    segments = np.array([w.segments for w in geom.wires], dtype=int)
+    return p1, p2, radius, segments
+
 
 def get_geometry_dimensions(geom: Geometry):
-    wires = geom.wires
-    points = [w.p1 for w in wires] + [w.p2 for w in wires]
-    points = np.array(points).T
-    mx = 0
-    for dim in points:
-        mx = max(mx, dim.max() - dim.min())
-    return mx
+    p1, p2, _, _ = geometry_to_arrays(geom)
+    return get_dimensions(p1, p2)
+
+
+def scale_segments(segments: np.ndarray, fidelity: float = 1.0) -> np.ndarray:
+    """
+    Number of segments of each wire at a reduced fidelity (fraction of full fidelity).
+    """
+    return np.maximum(1, np.around(segments * fidelity)).astype(int)
+
+
+def _wire_template(wire_radius: float):
+    key = ("Wire", 1, wire_radius)
+    if key not in _shape_templates:
+        unit = Geometry([Wire((0, -0.5, 0), (0, 0.5, 0), wire_radius)])
+        _shape_templates[key] = geometry_to_arrays(unit)
+    return _shape_templates[key]
 
 
 class WireParametrization(BaseObjectParametrization):
@@ -28,10 +54,111 @@ class WireParametrization(BaseObjectParametrization):
         g.rotate(*orientation)
         return g
 
+    def get_segments(
+        self, size_ratios, wire_radius: float = 0.5 * 1e-3, fidelity: float = 1.0
+    ):
+        lengths = self.min_size + (self.max_size - self.min_size) * size_ratios
+        p1, p2, radius, segments = _wire_template(wire_radius)
+        segments = scale_segments(segments, fidelity)
+
+        count = len(lengths)
+        return (
+            p1[None] * lengths[:, None, None],
+            p2[None] * lengths[:, None, None],
+            np.tile(radius, (count, 1)),
+            np.tile(segments, (count, 1)),
+        )
+
+
+def _srr_template(num: int, wr: float):
+    """
+    Unit double SRR with both rings of radius 1 and a mask of the outer ring points.
+    None if the rings do not scale linearly with their radii.
+    """
+    key = ("SRR", num, wr)
+    if key in _shape_templates:
+        return _shape_templates[key]
+
+    p1, p2, radius, segments = geometry_to_arrays(
+        double_SRR(inner_radius=1.0, outer_radius=2.0, wire_radius=wr, num_of_wires=num)
+    )
+    outer1 = np.linalg.norm(p1, axis=-1) > 1.5
+    outer2 = np.linalg.norm(p2, axis=-1) > 1.5
+    template = (
+        p1 / np.where(outer1, 2.0, 1.0)[:, None],
+        p2 / np.where(outer2, 2.0, 1.0)[:, None],
+        outer1,
+        outer2,
+        radius,
+        segments,
+    )
+
+    r_check = 5 * 1e-3
+    reference = double_SRR(
+        inner_radius=r_check,
+        outer_radius=r_check + 5 * wr,
+        wire_radius=wr,
+        num_of_wires=num,
+    )
+    scaled = _scale_srr_template(template, np.array([r_check]), wr)
+    if not all(
+        np.allclose(a[0], b) for a, b in zip(scaled, geometry_to_arrays(reference))
+    ):
+        template = None
+
+    _shape_templates[key] = template
+    return template
+
+
+def _scale_srr_template(template, radii: np.ndarray, wr: float):
+    unit_p1, unit_p2, outer1, outer2, radius, segments = template
+    inner, outer = radii[:, None, None], radii[:, None, None] + 5 * wr
+
+    count = len(radii)
+    return (
+        unit_p1[None] * np.where(outer1[None, :, None], outer, inner),
+        unit_p2[None] * np.where(outer2[None, :, None], outer, inner),
+        np.tile(radius, (count, 1)),
+        np.tile(segments, (count, 1)),
+    )
+
+
+def double_srr_arrays(radii: np.ndarray, wr=0.25 * 1e-3, num=20, fidelity=1.0):
+    """
+    Wires of double SRRs with the given inner radii. At reduced fidelity the rings
+    are made of fewer wires with fewer segments each.
+    """
+    radii = np.asarray(radii, dtype=float)
+    if fidelity != 1.0:
+        num = max(4, int(np.around(num * fidelity)))
+        p1, p2, radius, segments = double_srr_arrays(radii, wr, num)
+        return p1, p2, radius, scale_segments(segments, fidelity)
+
+    template = _srr_template(num, wr)
+    if template is not None:
+        return _scale_srr_template(template, radii, wr)
+
+    arrays = [
+        geometry_to_arrays(
+            double_SRR(
+                inner_radius=r,
+                outer_radius=r + 5 * wr,
+                wire_radius=wr,
+                num_of_wires=num,
+            )
+        )
+        for r in radii
+    ]
+    return tuple(np.array(a) for a in zip(*arrays))
+
 
 def double_srr_updated(r=3.25 * 1e-3, p0=(0, 0, 0), wr=0.25 * 1e-3, num=20):
-    g = double_SRR(
-        inner_radius=r, outer_radius=r + 5 * wr, wire_radius=wr, num_of_wires=num
+    p1, p2, radius, segments = (a[0] for a in double_srr_arrays([r], wr, num))
+    g = Geometry(
+        [
+            Wire(a, b, rad, segments=int(seg))
+            for a, b, rad, seg in zip(p1, p2, radius, segments)
+        ]
     )
     g.translate(p0)
 
@@ -48,6 +175,12 @@ class SRRParametrization(BaseObjectParametrization):
         g.rotate(*orientation)
         return g
 
+    def get_segments(
+        self, size_ratios, wire_radius: float = 0.5 * 1e-3, fidelity: float = 1.0
+    ):
+        radii = self.min_size + (self.max_size - self.min_size) * size_ratios
+        return double_srr_arrays(radii, wr=wire_radius, fidelity=fidelity)
+
 
 if __name__ == "__main__":
     wire_param = WireParametrization(20 * 1e-3)
@@ -7,17 +7,32 @@ from wirenec.visualization import plot_geometry
 from wirenec_optimization.parametrization.base_parametrization import (
     BaseStructureParametrization,
 )
+from wirenec_optimization.parametrization.geometry_builder import (
+    WireArrays,
+    build_cells,
+    expand_cells,
+)
 from wirenec_optimization.parametrization.sample_objects import (
     WireParametrization,
     SRRParametrization,
-    get_geometry_dimensions,
 )
+from wirenec_optimization.parametrization.symmetry import CellSymmetry
 
 
 class SpatialParametrization(BaseStructureParametrization):
     def __init__(
-        self, matrix_size, tau_x, tau_y, tau_z, asymmetry_factor: Optional[float] = None
+        self,
+        matrix_size,
+        tau_x,
+        tau_y,
+        tau_z,
+        asymmetry_factor: Optional[float] = None,
+        symmetry: Optional[dict] = None,
     ):
+        """
+        symmetry: keyword arguments of CellSymmetry (mirror, rotation, supercell), cells
+        of an xy layer related by the symmetry share their genes.
+        """
         super().__init__("spatial")
 
         self.type_mapping = {0: WireParametrization, 1: SRRParametrization}
@@ -30,94 +45,100 @@ class SpatialParametrization(BaseStructureParametrization):
 
         self.asymmetry_factor = asymmetry_factor
 
+        self.symmetry = symmetry
+        self.cell_orbits = None
+        if symmetry is not None:
+            m, n, k = matrix_size
+            self.cell_orbits = CellSymmetry(**symmetry).orbits(
+                (m, n), k, (tau_x, tau_y)
+            )
+
     @property
     def optimized_objects_count(self):
+        if self.cell_orbits is not None:
+            return self.cell_orbits[0].max() + 1
         return np.prod(self.matrix_size)
 
     @property
     def bounds(self) -> np.ndarray:
-        m, n, k = self.matrix_size
+        cells_count = int(self.optimized_objects_count)
 
-        size_bounds = [(0, 1) for _ in range(n * m)] * k
-        orientation_bounds = [(0, 2 * np.pi) for _ in range(n * m)] * 3 * k
-        types_bounds = [
-            (0, len(self.type_mapping.keys()) - 1) for _ in range(n * m)
-        ] * k
+        size_bounds = [(0, 1)] * cells_count
+        orientation_bounds = [(0, 2 * np.pi)] * 3 * cells_count
+        types_bounds = [(0, len(self.type_mapping.keys()) - 1)] * cells_count
 
         if self.asymmetry_factor:
-            delta_bounds = [(0, 1) for _ in range(n * m)] * k * 3
+            delta_bounds = [(0, 1)] * cells_count * 3
         else:
             delta_bounds = []
 
         return np.array(types_bounds + size_bounds + orientation_bounds + delta_bounds)
 
+    @property
+    def steps(self) -> np.ndarray:
+        # Type genes are integer indices of type_mapping
+        steps = np.zeros(len(self.bounds))
+        steps[: int(self.optimized_objects_count)] = 1
+        return steps
+
     def get_random_geometry(self, seed: int = 42) -> Geometry:
         np.random.seed(seed)
         bounds = self.bounds
         random_parameters = [np.random.uniform(low=mn, high=mx) for (mn, mx) in bounds]
         return self.get_geometry(random_parameters)
 
-    def get_geometry(self, params: [np.ndarray, list]) -> Geometry:
+    def get_cell_positions(self) -> np.ndarray:
         m, n, k = self.matrix_size
-        split_size = m * n * k
-        types_params, size_params, orientation_params = (
-            np.array_split(params[:split_size], k),
-            np.array_split(params[split_size : 2 * split_size], k),
-            np.array_split(params[2 * split_size : 5 * split_size], k),
+        a_x, a_y = self.tau_x * n, self.tau_y * m
+        x0, y0 = -a_x / 2 + self.tau_x / 2, -a_y / 2 + self.tau_y / 2
+
+        l, i, j = np.meshgrid(np.arange(k), np.arange(m), np.arange(n), indexing="ij")
+        return np.stack(
+            [x0 + self.tau_x * i, y0 + self.tau_y * j, self.tau_z * l], axis=-1
+        ).reshape(-1, 3)
+
+    def get_wire_arrays(
+        self, params: [np.ndarray, list], fidelity: float = 1.0
+    ) -> WireArrays:
+        params = np.asarray(params, dtype=float)
+        cells_count = int(self.optimized_objects_count)
+
+        types = np.around(params[:cells_count]).astype(int)
+        size_ratios = params[cells_count : 2 * cells_count]
+        orientations = params[2 * cells_count : 5 * cells_count].reshape(-1, 3)
+
+        wires, obj_size_max = build_cells(
+            self.type_mapping, types, size_ratios, orientations, fidelity=fidelity
         )
 
+        shifts = np.zeros((cells_count, 3))
         if self.asymmetry_factor:
-            delta_params = np.array_split(params[5 * split_size :], k)
-
-        wires = []
-        a_x, a_y, a_z = self.tau_x * n, self.tau_y * m, self.tau_z * k
-        x0, y0, z0 = (
-            -a_x / 2 + self.tau_x / 2,
-            -a_y / 2 + self.tau_y / 2,
-            -a_y / 2 + self.tau_z / 2,
-        )
-        for l in range(k):
-            for i in range(m):
-                for j in range(n):
-                    tp, size_ratio, orientation = (
-                        int(np.around(types_params[l].reshape((m, n))[i, j])),
-                        size_params[l].reshape((m, n))[i, j],
-                        orientation_params[l].reshape((m, n, 3))[i, j],
-                    )
-
-                    orientation = tuple(orientation)
-                    g_tmp = self.type_mapping[tp]().get_geometry(
-                        size_ratio, orientation
-                    )
-
-                    if self.asymmetry_factor:
-                        phi_rel, theta_rel, dr_rel = delta_params[l].reshape((m, n, 3))[
-                            i, j
-                        ]
-                        obj_size_max = get_geometry_dimensions(g_tmp)
-                        tau = min(self.tau_x, self.tau_y, self.tau_z)
-                        phi, theta, dr = (
-                            phi_rel * 2 * np.pi,
-                            theta_rel * np.pi,
-                            (tau - obj_size_max) / 2 * self.asymmetry_factor * dr_rel,
-                        )
-                        dx, dy, dz = (
-                            dr * np.sin(theta) * np.cos(phi),
-                            dr * np.sin(theta) * np.sin(phi),
-                            dr * np.cos(theta),
-                        )
-                    else:
-                        dx = dy = dz = 0
-
-                    x, y, z = (
-                        x0 + self.tau_x * i + dx,
-                        y0 + self.tau_y * j + dy,
-                        self.tau_z * l + dz,
-                    )
-                    g_tmp.translate((x, y, z))
-                    wires += g_tmp.wires
-
-        return Geometry(wires)
+            phi_rel, theta_rel, dr_rel = (
+                params[5 * cells_count :].reshape(cells_count, 3).T
+            )
+            tau = min(self.tau_x, self.tau_y, self.tau_z)
+            phi, theta = phi_rel * 2 * np.pi, theta_rel * np.pi
+            dr = (tau - obj_size_max) / 2 * self.asymmetry_factor * dr_rel
+            shifts = np.stack(
+                [
+                    dr * np.sin(theta) * np.cos(phi),
+                    dr * np.sin(theta) * np.sin(phi),
+                    dr * np.cos(theta),
+                ],
+                axis=-1,
+            )
+
+        if self.cell_orbits is None:
+            return wires.translate(self.get_cell_positions() + shifts)
+
+        # Objects are built once per orbit and mapped to all of its cells
+        wires = expand_cells(wires.translate(shifts), *self.cell_orbits)
+        return wires.translate(self.get_cell_positions())
+
+    def get_geometry(
+        self, params: [np.ndarray, list], fidelity: float = 1.0
+    ) -> Geometry:
+        return self.get_wire_arrays(params, fidelity).to_geometry()
 
 
 if __name__ == "__main__":
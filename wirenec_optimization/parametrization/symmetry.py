@@ -0,0 +1,137 @@
+from typing import Optional
+
+import numpy as np
+
+MIRRORS = {"x": np.diag([-1, 1, 1]), "y": np.diag([1, -1, 1])}
+ROTATIONS = (1, 2, 4)
+
+
+class CellSymmetry:
+    """
+    Symmetry of a grid of cells in the xy plane: mirror planes (x -> -x for "x",
+    y -> -y for "y"), C2 or C4 rotation around z and translational tiling of a
+    supercell of a x b cells. Point symmetries act on the cells of the supercell
+    around its center. Cells related by the symmetry form an orbit that shares one set
+    of genes, the object of the first cell of the orbit is mapped to the other cells.
+    Objects themselves are not symmetric, so no cell may lie on a mirror plane or the
+    rotation axis, i.e. the supercell needs an even number of cells along the
+    mirrored axes and both axes of a rotation. A mirror combined with C4 adds the
+    diagonal mirror planes, which always contain cells.
+    """
+
+    def __init__(
+        self,
+        mirror: tuple = (),
+        rotation: int = 1,
+        supercell: Optional[tuple] = None,
+    ):
+        for axis in mirror:
+            if axis not in MIRRORS:
+                raise ValueError(
+                    f"Unknown mirror axis {axis}, use one of {list(MIRRORS)}"
+                )
+        if rotation not in ROTATIONS:
+            raise ValueError(
+                f"Unsupported rotation order {rotation}, use one of {ROTATIONS}"
+            )
+
+        self.mirror = tuple(mirror)
+        self.rotation = rotation
+        self.supercell = None if supercell is None else tuple(supercell)
+
+    def group(self) -> list[np.ndarray]:
+        """
+        Point group generated by the mirrors and the rotation, identity first.
+        """
+        generators = [MIRRORS[axis] for axis in self.mirror]
+        if self.rotation > 1:
+            angle = 2 * np.pi / self.rotation
+            generators.append(
+                np.rint(
+                    [
+                        [np.cos(angle), -np.sin(angle), 0],
+                        [np.sin(angle), np.cos(angle), 0],
+                        [0, 0, 1],
+                    ]
+                )
+            )
+
+        elements = {tuple(np.eye(3, dtype=int).ravel()): np.eye(3, dtype=int)}
+        frontier = list(elements.values())
+        while frontier:
+            element = frontier.pop()
+            for generator in generators:
+                product = np.rint(generator @ element).astype(int)
+                key = tuple(product.ravel())
+                if key not in elements:
+                    elements[key] = product
+                    frontier.append(product)
+        return list(elements.values())
+
+    def orbits(
+        self, matrix_size: tuple, layers_num: int, spacing: tuple
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Orbit index of every cell of a layers_num x m x n grid (in the order of
+        get_cell_positions, x along m with spacing[0], y along n with spacing[1]) and
+        the transform mapping the first cell of its orbit onto the cell. Orbits are
+        numbered in cell order of their first cells, so without symmetry every cell is
+        its own orbit.
+        """
+        m, n = matrix_size
+        a, b = self.supercell or (m, n)
+        if a > m or b > n:
+            raise ValueError(f"Supercell {(a, b)} is larger than the grid {(m, n)}")
+
+        # Point symmetries on the cells of the supercell
+        u, v = np.meshgrid(np.arange(a), np.arange(b), indexing="ij")
+        local = np.stack(
+            [
+                spacing[0] * (u.ravel() - (a - 1) / 2),
+                spacing[1] * (v.ravel() - (b - 1) / 2),
+                np.zeros(a * b),
+            ],
+            axis=-1,
+        )
+
+        def position_key(position: np.ndarray) -> tuple:
+            return tuple(np.around(position / min(spacing), 6))
+
+        cell_of_position = {position_key(p): i for i, p in enumerate(local)}
+
+        group = self.group()
+        images = np.empty((len(group), a * b), dtype=int)
+        for g, element in enumerate(group):
+            for i, position in enumerate(local @ element.T):
+                key = position_key(position)
+                if key not in cell_of_position:
+                    raise ValueError(
+                        f"Symmetry {self.mirror, self.rotation} does not map the "
+                        f"{a}x{b} supercell onto itself"
+                    )
+                images[g, i] = cell_of_position[key]
+
+        # Cells mapped onto themselves would need a symmetric object
+        self_mapped = np.flatnonzero((images[1:] == np.arange(a * b)).any(axis=0))
+        if len(self_mapped):
+            raise ValueError(
+                f"{len(self_mapped)} cells of the {a}x{b} supercell lie on a mirror "
+                f"plane or the rotation axis of symmetry {self.mirror, self.rotation}, "
+                f"use an even number of cells along the mirrored and rotated axes"
+            )
+
+        first = images.min(axis=0)
+        local_transforms = np.empty((a * b, 3, 3))
+        for i in range(a * b):
+            # The images of the first cell cover its orbit, the first match is used
+            g = np.flatnonzero(images[:, first[i]] == i)[0]
+            local_transforms[i] = group[g]
+
+        # Translational tiling of the supercell over the grid
+        layer, i, j = np.meshgrid(
+            np.arange(layers_num), np.arange(m), np.arange(n), indexing="ij"
+        )
+        local_index = ((i % a) * b + j % b).ravel()
+        first_cell = layer.ravel() * a * b + first[local_index]
+        _, orbit = np.unique(first_cell, return_inverse=True)
+        return orbit, local_transforms[local_index]